@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+""" benchmark for the python and numpy backends of maths
+
+    times the vector functions on vectors of 10, 10**3 and 10**6 elements,
+    and a batch of 10**5 pairs of 3-vectors in one call against a loop
+
+        python benchmarks/bench_maths_backend.py
+
+    NB the numpy backend is timed with arrays as input; passing lists adds
+       the conversion to every call, which is also shown.
+"""
+import os, sys, time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from pdapt_lib.machine_learning import maths
+
+
+def timed(f, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - start) / repeat
+
+
+def cases(v, w):
+    return [("vector_add", lambda: maths.vector_add(v, w)),
+            ("vector_subtract", lambda: maths.vector_subtract(v, w)),
+            ("scalar_multiply", lambda: maths.scalar_multiply(2.0, v)),
+            ("dot", lambda: maths.dot(v, w)),
+            ("sum_of_squares", lambda: maths.sum_of_squares(v)),
+            ("magnitude", lambda: maths.magnitude(v)),
+            ("distance", lambda: maths.distance(v, w)),
+            ("vector_sum", lambda: maths.vector_sum([v, w], componentwise=True)),
+            ("vector_mean", lambda: maths.vector_mean([v, w], componentwise=True))]
+
+
+if __name__ == "__main__":
+    state = np.random.RandomState(0)
+    for size in (10, 1000, 10**6):
+        repeat = max(1, 10**5 // size)
+        x, y = state.normal(size=size), state.normal(size=size)
+        v, w = x.tolist(), y.tolist()
+        print("elements: %d" % size)
+        for (name, python), (_, numpy), (_, lists) in zip(cases(v, w), cases(x, y), cases(v, w)):
+            base = timed(python, repeat)
+            with maths.using_backend('numpy'):
+                arrays, converted = timed(numpy, repeat), timed(lists, repeat)
+            print("  %-16s python %10.2fus  numpy %10.2fus %7.1fx  numpy on lists %10.2fus"
+                  % (name, 1e6 * base, 1e6 * arrays, base / arrays, 1e6 * converted))
+
+    V, W = state.normal(size=(10**5, 3)), state.normal(size=(10**5, 3))
+    pairs = list(zip(V.tolist(), W.tolist()))
+    base = timed(lambda: [maths.distance(v, w) for v, w in pairs], 1)
+    with maths.using_backend('numpy'):
+        batch = timed(lambda: maths.distance(V, W), 10)
+    print("distance of 10**5 pairs of 3-vectors")
+    print("  python loop %8.4fs  numpy batch %8.4fs %7.1fx" % (base, batch, base / batch))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+""" benchmark for merging token dictionaries
+
+    times folding nlp.merge_tokens, nlp.merge_many, corpus.tree_merge and
+    the streaming merge of sorted count files over 10**3 to 10**5 shards
+
+        python benchmarks/bench_merge_tokens.py [largest number of shards]
+
+    NB folding merge_tokens copies the growing result for every shard, so it
+       is only timed up to 10**4 shards.
+"""
+import os, sys, time, random, shutil, tempfile
+from functools import reduce
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pdapt_lib.machine_learning import nlp, corpus
+
+
+def make_shards(count, seed=0):
+    """ per-document unigram counts over a zipf-like vocabulary """
+    random.seed(seed)
+    vocabulary = ["word%d" % i for i in range(20000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+    shards = []
+    for _ in range(count):
+        tokens = {}
+        for w in random.choices(vocabulary, weights, k=50):
+            tokens[w] = tokens.get(w, 0) + 1
+        shards.append(tokens)
+    return shards
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def merge_files(shards):
+    """ writes the shards to count files (not timed) and merges them """
+    folder = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(folder, "%d" % i) for i in range(len(shards))]
+        for path, tokens in zip(paths, shards):
+            corpus.write_counts(tokens, path)
+        elapsed, merged = timed(lambda: dict(corpus.iter_merged_counts(paths)))
+    finally:
+        shutil.rmtree(folder)
+    return elapsed, merged
+
+
+if __name__ == "__main__":
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    count = 1000
+    while count <= largest:
+        shards = make_shards(count)
+        print("shards: %d" % count)
+        base, expected = timed(lambda: nlp.merge_many(shards))
+        print("  %-24s %8.3fs" % ("merge_many", base))
+        if count <= 10000:
+            elapsed, result = timed(lambda: reduce(nlp.merge_tokens, shards, {}))
+            assert result == expected
+            print("  %-24s %8.3fs  %6.1fx merge_many" % ("fold merge_tokens", elapsed, elapsed / base))
+        elapsed, result = timed(lambda: corpus.tree_merge(shards))
+        assert result == expected
+        print("  %-24s %8.3fs  %6.1fx merge_many" % ("tree_merge", elapsed, elapsed / base))
+        elapsed, result = merge_files(shards)
+        assert result == expected
+        print("  %-24s %8.3fs  %6.1fx merge_many" % ("merged count files", elapsed, elapsed / base))
+        count *= 10
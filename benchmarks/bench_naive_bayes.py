@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+""" benchmark for classification.NaiveBayes
+
+    documents per second for training, online updates and batch
+    prediction, against scoring documents one at a time from the
+    probability table; most of the time for raw text goes into tokenize,
+    so the token dictionaries are also timed on their own
+
+        python benchmarks/bench_naive_bayes.py [documents]
+"""
+import os, sys, time, random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pdapt_lib.machine_learning.classification import NaiveBayes
+from pdapt_lib.machine_learning.nlp import tokenize
+
+
+def make_documents(size, classes=5, seed=0):
+    """ documents drawn from overlapping class vocabularies """
+    random.seed(seed)
+    vocabulary = ["word%d" % i for i in range(20000)]
+    docs, labels = [], []
+    for _ in range(size):
+        c = random.randrange(classes)
+        words = vocabulary[c*3000:c*3000 + 8000]
+        docs.append(" ".join(random.choice(words) for _ in range(80)))
+        labels.append("class%d" % c)
+    return docs, labels
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def predict_one_at_a_time(nb, docs):
+    """ per document dictionary lookups into the log probability table """
+    priors, log_probs, bias = nb.tables()
+    labels = []
+    for doc in docs:
+        scores = list(priors + bias)
+        for w, count in nb._tokens(doc).items():
+            i = nb.vocabulary.get(w)
+            if i is not None:
+                for c in range(len(scores)):
+                    scores[c] += (count if nb.kind == 'multinomial' else 1) * log_probs[c, i]
+        labels.append(nb.classes[scores.index(max(scores))])
+    return labels
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    docs, labels = make_documents(size)
+    print("documents: %d" % size)
+    elapsed, tokens = timed(lambda: [tokenize(d) for d in docs])
+    print("%-12s %-26s %10.0f docs/s" % ("", "tokenize", size / elapsed))
+    for kind in ('multinomial', 'bernoulli'):
+        elapsed, nb = timed(lambda: NaiveBayes(kind).fit(docs, labels))
+        print("%-12s %-26s %10.0f docs/s" % (kind, "fit", size / elapsed))
+        online = NaiveBayes(kind)
+        elapsed, _ = timed(lambda: [online.partial_fit(docs[i:i+100], labels[i:i+100]) for i in range(0, size, 100)])
+        print("%-12s %-26s %10.0f docs/s" % (kind, "partial_fit, 100 at a time", size / elapsed))
+        elapsed, predicted = timed(lambda: nb.predict(docs))
+        print("%-12s %-26s %10.0f docs/s" % (kind, "predict, sparse batch", size / elapsed))
+        elapsed, _ = timed(lambda: NaiveBayes(kind).fit(tokens, labels))
+        print("%-12s %-26s %10.0f docs/s" % (kind, "fit, token dicts", size / elapsed))
+        elapsed, _ = timed(lambda: nb.predict(tokens))
+        print("%-12s %-26s %10.0f docs/s" % (kind, "predict, token dicts", size / elapsed))
+        sample = tokens[:2000]
+        elapsed, one_by_one = timed(lambda: predict_one_at_a_time(nb, sample))
+        assert one_by_one == predicted[:2000]
+        print("%-12s %-26s %10.0f docs/s" % (kind, "predict, one at a time", len(sample) / elapsed))
+        accuracy = sum(p == l for p, l in zip(predicted, labels)) / float(size)
+        print("%-12s %-26s %10.3f" % (kind, "training accuracy", accuracy))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+""" benchmark for corpus.parallel_tokenize
+
+    times the serial path (count_corpus) against parallel_tokenize with
+    increasing numbers of worker processes
+
+        python benchmarks/bench_parallel_tokenize.py [documents]
+"""
+import os, sys, time, random, multiprocessing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pdapt_lib.machine_learning import corpus
+
+
+def make_corpus(size, seed=0):
+    """ random documents over a zipf-like vocabulary """
+    random.seed(seed)
+    vocabulary = ["word%d" % i if i % 7 else "Term" for i in range(5000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+    sentences = ["It's a fine day, isn't it?", "The U.S. data on JAK-1 looks good.", "I think i can."]
+    return [" ".join(random.choices(vocabulary, weights, k=60)) + " " + random.choice(sentences)
+            for _ in range(size)]
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    docs = make_corpus(size)
+    print("documents: %d, cores: %d" % (size, multiprocessing.cpu_count()))
+
+    base, expected = timed(lambda: corpus.count_corpus(docs, 2))
+    print("%-28s %8.2fs" % ("serial count_corpus", base))
+    processes = 1
+    while processes <= multiprocessing.cpu_count():
+        elapsed, result = timed(lambda: corpus.parallel_tokenize(docs, 2, processes=processes, chunk_size=500))
+        assert result == expected
+        print("%-28s %8.2fs  speedup %5.1fx" % ("parallel, %d process(es)" % processes, elapsed, base / elapsed))
+        processes *= 2
@@ -10,8 +10,10 @@
 """
 
 import math, random
+from itertools import islice
 from collections import defaultdict
 from pdapt_lib.machine_learning.maths import sum_of_squares, dot
+from pdapt_lib.machine_learning.nlp import Vocabulary, tokenize
 import numpy as np
 from math import sqrt
 
@@ -48,3 +50,149 @@ def logistic_derivative(xs):
     """
     """
     return logistic(xs) * (1.0 - logistic(xs))
+
+
+# Naive Bayes
+
+class NaiveBayes(object):
+    """ multinomial or Bernoulli Naive Bayes text classifier
+    Input: kind 'multinomial' (word counts) or 'bernoulli' (word presence),
+           additive smoothing alpha, tokenize options
+
+    NB documents are strings (tokenized with nlp.tokenize) or token
+       dictionaries.  Training only adds counts to a (classes, vocabulary)
+       array indexed by nlp.Vocabulary ids, so documents can be streamed
+       and partial_fit can be called at any time; the log probability
+       tables are rebuilt from the counts when next needed.
+    NB a batch of documents is scored with one sparse matrix product
+       against the log probability table; unseen words are ignored.
+
+    >>> nb = NaiveBayes()
+    >>> nb.fit(["the rain in Spain", "rain falls on the plain", "a fine sunny day", "sunny and warm"],
+    ...        ['wet', 'wet', 'dry', 'dry'])
+    NaiveBayes('multinomial', 2 classes, 13 words)
+    >>> nb.predict(["rain again", "a warm day"])
+    ['wet', 'dry']
+    >>> nb.partial_fit(["snow falls"], ['cold']).predict(["snow"])
+    ['cold']
+    >>> NaiveBayes('bernoulli').fit(["the rain", "the sun"], ['wet', 'dry']).predict(["rain"])
+    ['wet']
+    """
+    def __init__(self, kind='multinomial', alpha=1.0, n=1, removing_stopwords=False, stemming=False):
+        if kind not in ('multinomial', 'bernoulli'):
+            raise ValueError("kind must be 'multinomial' or 'bernoulli'")
+        self.kind = kind
+        self.alpha = alpha
+        self.tokenize_options = (n, removing_stopwords, stemming)
+        self.vocabulary = Vocabulary()
+        self.classes = []       # class index -> label
+        self.class_index = {}   # label -> class index
+        self.class_documents = np.zeros(0, dtype=np.int64)
+        self.feature_counts = np.zeros((0, 0), dtype=np.int64)
+        self._tables = None
+
+    def __repr__(self):
+        return "NaiveBayes(%r, %d classes, %d words)" % (self.kind, len(self.classes), len(self.vocabulary))
+
+    def _tokens(self, doc):
+        if isinstance(doc, str):
+            return tokenize(doc, *self.tokenize_options)
+        return doc
+
+    def partial_fit(self, docs, labels):
+        """ add documents with their labels to the counts """
+        rows, columns, values = [], [], []
+        new_documents = []
+        for doc, label in zip(docs, labels):
+            if label not in self.class_index:
+                self.class_index[label] = len(self.classes)
+                self.classes.append(label)
+            c = self.class_index[label]
+            new_documents.append(c)
+            for w, count in self._tokens(doc).items():
+                rows.append(c)
+                columns.append(self.vocabulary.add(w))
+                values.append(count if self.kind == 'multinomial' else 1)
+        classes, words = len(self.classes), len(self.vocabulary)
+        if classes > self.feature_counts.shape[0] or words > self.feature_counts.shape[1]:
+            # grow the vocabulary axis geometrically, so growing is amortized
+            capacity = max(words, 2*self.feature_counts.shape[1]) if words > self.feature_counts.shape[1] \
+                else self.feature_counts.shape[1]
+            grown = np.zeros((classes, capacity), dtype=np.int64)
+            grown[:self.feature_counts.shape[0], :self.feature_counts.shape[1]] = self.feature_counts
+            self.feature_counts = grown
+            self.class_documents = np.concatenate([self.class_documents,
+                                                   np.zeros(classes - len(self.class_documents), dtype=np.int64)])
+        np.add.at(self.feature_counts, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)),
+                  np.array(values, dtype=np.int64))
+        np.add.at(self.class_documents, np.array(new_documents, dtype=np.intp), 1)
+        self._tables = None
+        return self
+
+    def fit(self, docs, labels, batch=1000):
+        """ train from scratch, reading docs and labels a batch at a time """
+        self.__init__(self.kind, self.alpha, *self.tokenize_options)
+        pairs = iter(zip(docs, labels))
+        while True:
+            chunk = list(islice(pairs, batch))
+            if not chunk:
+                return self
+            self.partial_fit([d for d, _ in chunk], [l for _, l in chunk])
+
+    def tables(self):
+        """ (class log priors, (classes, words) log probabilities, bias)
+
+        NB for bernoulli the table holds log p - log(1-p) and the bias the
+           sum of log(1-p) over the vocabulary, so that scoring is one
+           product with the word presence matrix plus the bias.
+        """
+        if self._tables is None:
+            words = len(self.vocabulary)
+            counts = self.feature_counts[:, :words].astype(np.float64)
+            priors = np.log(self.class_documents / float(self.class_documents.sum()))
+            if self.kind == 'multinomial':
+                totals = counts.sum(axis=1, keepdims=True)
+                log_probs = np.log(counts + self.alpha) - np.log(totals + self.alpha*words)
+                bias = np.zeros(len(self.classes))
+            else:
+                p = (counts + self.alpha) / (self.class_documents[:, None] + 2.0*self.alpha)
+                log_probs = np.log(p) - np.log1p(-p)
+                bias = np.log1p(-p).sum(axis=1)
+            self._tables = (priors, log_probs, bias)
+        return self._tables
+
+    def transform(self, docs):
+        """ scipy.sparse csr matrix of token counts (presence for bernoulli),
+        a row per document and a column per vocabulary id
+        """
+        from scipy import sparse
+        data, indices, indptr = [], [], [0]
+        for doc in docs:
+            row = {}
+            for w, count in self._tokens(doc).items():
+                i = self.vocabulary.get(w)
+                if i is not None:
+                    row[i] = row.get(i, 0) + count
+            for i in sorted(row):
+                indices.append(i)
+                data.append(row[i] if self.kind == 'multinomial' else 1)
+            indptr.append(len(indices))
+        return sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64),
+                                  np.array(indptr, dtype=np.int64)),
+                                 shape=(len(indptr) - 1, len(self.vocabulary)))
+
+    def joint_log_likelihood(self, docs):
+        """ (documents, classes) array of log P(class) + log P(document | class) """
+        priors, log_probs, bias = self.tables()
+        X = self.transform(docs)
+        return np.asarray(X @ log_probs.T) + priors + bias
+
+    def predict_log_proba(self, docs):
+        """ (documents, classes) array of log P(class | document) """
+        jll = self.joint_log_likelihood(docs)
+        top = jll.max(axis=1, keepdims=True)
+        return jll - (top + np.log(np.exp(jll - top).sum(axis=1, keepdims=True)))
+
+    def predict(self, docs):
+        """ most likely label of each document """
+        return [self.classes[i] for i in self.joint_log_likelihood(docs).argmax(axis=1)]
@@ -0,0 +1,276 @@
+#  corpus.py
+#
+#  Author: Matthew K. MacLeod
+#
+#  For license information see license.txt
+
+""" Corpus
+
+  tokenizing collections of documents too large to hold in memory
+
+"""
+from pdapt_lib.machine_learning.nlp import preprocess, n_gram, tokenize
+from collections import deque
+from itertools import islice, groupby
+from operator import itemgetter
+import heapq
+import multiprocessing
+import os
+import tempfile
+
+
+def read_documents(source, chunk_size=None, encoding='utf-8'):
+    """ generator over the documents of a corpus
+    Input: file path, file object or iterable of strings,
+           optional chunk_size (characters) to read a file in chunks
+    Output: documents, one for each line of a file or item of an iterable
+
+    NB line endings are removed.
+    NB with chunk_size a file is read in pieces of roughly chunk_size
+       characters cut after whitespace, so no word is split; use this for
+       files without line breaks (together with carry, see stream_tokenize).
+       Each chunk is then processed as a document of its own.
+
+    >>> list(read_documents(["the rain in", "Spain falls"]))
+    ['the rain in', 'Spain falls']
+    >>> import io
+    >>> list(read_documents(io.StringIO("the rain in Spain falls"), chunk_size=8))
+    ['the ', 'rain in ', 'Spain ', 'falls']
+    """
+    if isinstance(source, str):
+        with open(source, encoding=encoding) as f:
+            for doc in read_documents(f, chunk_size):
+                yield doc
+    elif chunk_size is not None and hasattr(source, 'read'):
+        rest = ''
+        chunk = source.read(chunk_size)
+        while chunk:
+            text = rest + chunk
+            cut = len(text)
+            while cut > 0 and not text[cut-1].isspace():
+                cut -= 1
+            if cut > 0:
+                yield text[:cut]
+            rest = text[cut:]
+            chunk = source.read(chunk_size)
+        if rest:
+            yield rest
+    elif hasattr(source, 'read'):
+        for line in source:
+            yield line.rstrip('\r\n')
+    else:
+        for doc in source:
+            yield doc
+
+
+def stream_tokenize(source, n=1, removing_stopwords=False, stemming=False, carry=False, chunk_size=None):
+    """ tokenize a corpus one document at a time
+    Input: source as for read_documents, tokenize options,
+           carry n-grams over document boundaries, chunk_size as for read_documents
+    Output: generator of token dictionaries, one per document
+
+    NB without carry each dictionary is exactly tokenize(document, ...).
+    NB with carry the documents are treated as one running text: an n-gram
+       that starts in one document and ends in the next is counted with the
+       later one, and the empty token tokenize leaves for punctuation at
+       either end of a document is dropped.  Only the last n-1 words are
+       kept between documents.
+
+    >>> list(stream_tokenize(["the rain in", "Spain falls"], 2))
+    [{'the rain': 1, 'rain in': 1}, {'spain falls': 1}]
+    >>> list(stream_tokenize(["the rain in", "Spain falls"], 2, carry=True))
+    [{'the rain': 1, 'rain in': 1}, {'in spain': 1, 'spain falls': 1}]
+    """
+    tail = []
+    for doc in read_documents(source, chunk_size):
+        s = preprocess(doc, removing_stopwords, stemming)
+        if carry:
+            s = s.strip(" ")
+            words = tail + s.split(" ") if s else tail
+            ngrams = [" ".join(words[i:i+n]) for i in range(len(words)-(n-1))]
+            tail = words[-(n-1):] if n > 1 else []
+        else:
+            ngrams = n_gram(n, s)
+        tokens = {}
+        for w in ngrams:
+            tokens[w] = tokens.get(w, 0) + 1
+        yield tokens
+
+
+def count_corpus(source, n=1, removing_stopwords=False, stemming=False, carry=False, chunk_size=None):
+    """ total token counts of a corpus
+    Input: as for stream_tokenize
+    Output: dictionary of ngram token keys and counts over all documents
+
+    NB counts are added up as the documents are read, so memory grows with
+       the vocabulary and not with the size of the corpus.
+
+    >>> sorted(count_corpus(["the rain in", "Spain falls in Spain"], 2, carry=True).items())
+    [('falls in', 1), ('in spain', 2), ('rain in', 1), ('spain falls', 1), ('the rain', 1)]
+    """
+    counts = {}
+    for tokens in stream_tokenize(source, n, removing_stopwords, stemming, carry, chunk_size):
+        for w, c in tokens.items():
+            counts[w] = counts.get(w, 0) + c
+    return counts
+
+
+# parallel tokenizing
+
+def _merge_into(a, b):
+    """ add the counts of the smaller dictionary into the larger one """
+    if len(a) < len(b):
+        a, b = b, a
+    for k, v in b.items():
+        a[k] = a.get(k, 0) + v
+    return a
+
+
+def tree_merge(token_dicts, inplace=False):
+    """ combine token dictionaries pairwise, as a tree
+    Input: iterable of token dictionaries, inplace to allow the
+           dictionaries to be reused for the result
+    Output: dictionary with the same counts as folding merge_tokens over them
+
+    NB dictionaries are merged like a binary counter: equal sized partial
+       results are combined as soon as both exist, each merge adds the smaller
+       into the larger, and no more than log2(N) partial results are held.
+
+    >>> sorted(tree_merge([{'a': 1}, {'a': 2, 'b': 1}, {'c': 1}]).items())
+    [('a', 3), ('b', 1), ('c', 1)]
+    """
+    stack = []
+    for tokens in token_dicts:
+        tokens, level = (tokens if inplace else dict(tokens)), 0
+        while stack and stack[-1][1] == level:
+            tokens, level = _merge_into(stack.pop()[0], tokens), level + 1
+        stack.append((tokens, level))
+    merged = {}
+    while stack:
+        merged = _merge_into(stack.pop()[0], merged)
+    return merged
+
+
+def _tokenize_chunk(args):
+    """ total token counts of a list of documents (runs in a worker) """
+    docs, n, removing_stopwords, stemming = args
+    counts = {}
+    for doc in docs:
+        for w, c in tokenize(doc, n, removing_stopwords, stemming).items():
+            counts[w] = counts.get(w, 0) + c
+    return counts
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    chunk = list(islice(it, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(it, size))
+
+
+def parallel_tokenize(source, n=1, removing_stopwords=False, stemming=False,
+                      processes=None, chunk_size=1000):
+    """ total token counts of a corpus, tokenized by a pool of processes
+    Input: source as for read_documents, tokenize options, number of worker
+           processes (default all cores), documents per work unit
+    Output: dictionary of ngram token keys and counts, same as count_corpus
+
+    NB work units are handed out as the source is read and only a couple per
+       worker are in flight, so the corpus is never held in memory.
+    NB the counts of each unit are combined with tree_merge.
+    NB n-grams are not carried over document boundaries.
+
+    >>> sorted(parallel_tokenize(["the rain in Spain", "falls in Spain"], 2, processes=2, chunk_size=1).items())
+    [('falls in', 1), ('in spain', 2), ('rain in', 1), ('the rain', 1)]
+    """
+    processes = processes or multiprocessing.cpu_count()
+    units = ((docs, n, removing_stopwords, stemming)
+             for docs in _chunks(read_documents(source), chunk_size))
+    if processes == 1:
+        return tree_merge(map(_tokenize_chunk, units), inplace=True)
+
+    def results(pool):
+        pending = deque()
+        for unit in units:
+            pending.append(pool.apply_async(_tokenize_chunk, (unit,)))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    with multiprocessing.Pool(processes) as pool:
+        return tree_merge(results(pool), inplace=True)
+
+
+# sorted count files
+
+def write_counts(tokens, path):
+    """ write token counts as lines of token<tab>count, sorted by token """
+    with open(path, 'w', encoding='utf-8') as f:
+        for token in sorted(tokens):
+            if '\t' in token or '\n' in token or '\r' in token:
+                raise ValueError("tokens may not hold tabs or line breaks: %r" % token)
+            f.write("%s\t%d\n" % (token, tokens[token]))
+
+
+def read_counts(path):
+    """ generator of (token, count) from a file of write_counts """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            token, count = line.rstrip('\n').rsplit('\t', 1)
+            yield token, int(count)
+
+
+def iter_merged_counts(paths, fan_in=256):
+    """ streaming k-way merge of sorted count files
+    Input: paths of files written by write_counts, most files open at once
+    Output: generator of (token, total count), sorted by token
+
+    NB only one line per file is held at a time.  With more than fan_in
+       files, groups of fan_in are first merged into temporary files.
+    """
+    paths, temporary = list(paths), []
+    try:
+        while len(paths) > fan_in:
+            merged = []
+            for i in range(0, len(paths), fan_in):
+                handle, path = tempfile.mkstemp(suffix='.counts')
+                os.close(handle)
+                temporary.append(path)
+                _write_lines(_merge_sorted(paths[i:i+fan_in]), path)
+                merged.append(path)
+            paths = merged
+        for item in _merge_sorted(paths):
+            yield item
+    finally:
+        for path in temporary:
+            os.remove(path)
+
+
+def _merge_sorted(paths):
+    runs = heapq.merge(*[read_counts(p) for p in paths], key=itemgetter(0))
+    for token, group in groupby(runs, key=itemgetter(0)):
+        yield token, sum(c for _, c in group)
+
+
+def _write_lines(items, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for token, count in items:
+            f.write("%s\t%d\n" % (token, count))
+
+
+def merge_count_files(paths, path, fan_in=256):
+    """ merge sorted count files into one sorted count file at path
+
+    >>> import tempfile, os
+    >>> folder = tempfile.mkdtemp()
+    >>> shards = [os.path.join(folder, name) for name in ('a', 'b', 'c')]
+    >>> for shard, tokens in zip(shards, [{'rain': 1, 'the': 2}, {'in': 1, 'rain': 1}, {'spain': 3}]):
+    ...     write_counts(tokens, shard)
+    >>> merge_count_files(shards, os.path.join(folder, 'total'), fan_in=2)
+    >>> list(read_counts(os.path.join(folder, 'total')))
+    [('in', 1), ('rain', 2), ('spain', 3), ('the', 2)]
+    >>> import shutil; shutil.rmtree(folder)
+    """
+    _write_lines(iter_merged_counts(paths, fan_in), path)
@@ -0,0 +1,204 @@
+#  count_table.py
+#
+#  Author: Matthew K. MacLeod
+#
+#  For license information see license.txt
+
+""" Count table
+
+  token counts stored on disk in a compact binary file that is memory
+  mapped, so it loads instantly and is shared between processes
+
+  file layout, all integers little endian int64:
+
+    header   magic b'PDAPTCT1', number of tokens n, bytes of text
+    offsets  n+1 byte offsets of each token in the text
+    counts   n counts
+    text     the utf-8 encoded tokens, sorted, back to back
+
+"""
+from array import array
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import numpy as np
+
+_magic = b'PDAPTCT1'
+_header = struct.Struct('<8sqq')
+
+
+def write_count_table(tokens, path):
+    """ write token counts as a count table file
+    Input: token dictionary, or iterable of (token, count) pairs sorted by
+           token (eg corpus.iter_merged_counts), file path
+
+    NB pairs are streamed: the text goes to a temporary file and only the
+       offsets and counts, 16 bytes per token, are held in memory.
+    NB the table is written next to path and then renamed onto it, so
+       CountTables still mapping an older file at path keep reading it.
+    """
+    if hasattr(tokens, 'items'):
+        tokens = sorted(tokens.items())
+    offsets, counts = array('q', [0]), array('q')
+    previous = None
+    folder = os.path.dirname(os.path.abspath(path))
+    handle, text_path = tempfile.mkstemp(suffix='.text', dir=folder)
+    table_path = None
+    try:
+        with os.fdopen(handle, 'wb') as text:
+            for token, count in tokens:
+                if previous is not None and token <= previous:
+                    raise ValueError("tokens must be unique and sorted: %r after %r" % (token, previous))
+                previous = token
+                data = token.encode('utf-8')
+                text.write(data)
+                offsets.append(offsets[-1] + len(data))
+                counts.append(count)
+        handle, table_path = tempfile.mkstemp(suffix='.ct', dir=folder)
+        with os.fdopen(handle, 'wb') as f:
+            f.write(_header.pack(_magic, len(counts), offsets[-1]))
+            f.write(np.asarray(offsets, dtype='<i8').tobytes())
+            f.write(np.asarray(counts, dtype='<i8').tobytes())
+            with open(text_path, 'rb') as text:
+                shutil.copyfileobj(text, f)
+        # mkstemp files are private, give the table the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(table_path, 0o666 & ~umask)
+        os.replace(table_path, path)
+        table_path = None
+    finally:
+        os.remove(text_path)
+        if table_path is not None:
+            os.remove(table_path)
+
+
+class CountTable(object):
+    """ read only token counts of a count table file
+    Input: file path
+
+    NB nothing is read until used: the file is memory mapped, with offsets
+       and counts as NumPy arrays over the mapping, and a lookup is a
+       binary search touching about log2(n) tokens.  Processes opening (or
+       receiving a pickled) table share the pages of the file.
+    NB close(), or using the table in a with statement, releases the mapping.
+    NB positions in the table serve as word ids of a sorted vocabulary.
+
+    >>> import tempfile, os
+    >>> path = os.path.join(tempfile.mkdtemp(), 'bigrams.ct')
+    >>> write_count_table({'the rain': 2, 'rain in': 2, 'in spain': 1}, path)
+    >>> table = CountTable(path)
+    >>> len(table), table['rain in'], table.get('in france')
+    (3, 2, 0)
+    >>> table.index('the rain'), table.token(0)
+    (2, 'in spain')
+    >>> list(table.items_with_prefix('rain '))
+    [('rain in', 2)]
+    >>> table.to_tokens() == {'the rain': 2, 'rain in': 2, 'in spain': 1}
+    True
+    >>> table.close()
+    >>> os.remove(path); os.rmdir(os.path.dirname(path))
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, n, size = _header.unpack(f.read(_header.size))
+            if magic != _magic:
+                raise ValueError("%s is not a count table" % path)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = _header.size
+        self.offsets = np.frombuffer(self._map, dtype='<i8', count=n + 1, offset=start)
+        self.counts = np.frombuffer(self._map, dtype='<i8', count=n, offset=start + 8*(n + 1))
+        self._text = start + 8*(2*n + 1)
+        # plain ints are much faster to index than numpy scalars
+        if sys.byteorder == 'little':
+            self._offsets = memoryview(self._map)[start:start + 8*(n + 1)].cast('q')
+            self._counts = memoryview(self._map)[start + 8*(n + 1):self._text].cast('q')
+        else:
+            self._offsets, self._counts = self.offsets.tolist(), self.counts.tolist()
+
+    def close(self):
+        """ release the mapping of the file; the table is unusable after """
+        if self._map is None:
+            return
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+            self._counts.release()
+        self.offsets = self.counts = self._offsets = self._counts = None
+        self._map.close()
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __reduce__(self):
+        # workers reopen the file rather than receive a copy of it
+        return (CountTable, (self.path,))
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _key(self, i):
+        return self._map[self._text + self._offsets[i]:self._text + self._offsets[i+1]]
+
+    def token(self, i):
+        """ token at position i """
+        return self._key(i).decode('utf-8')
+
+    def _search(self, key):
+        """ first position whose token is not below key (as bytes) """
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def index(self, token):
+        """ position of token, -1 if absent """
+        key = token.encode('utf-8')
+        i = self._search(key)
+        return i if i < len(self) and self._key(i) == key else -1
+
+    def get(self, token, default=0):
+        i = self.index(token)
+        return self._counts[i] if i >= 0 else default
+
+    def __getitem__(self, token):
+        i = self.index(token)
+        if i < 0:
+            raise KeyError(token)
+        return self._counts[i]
+
+    def __contains__(self, token):
+        return self.index(token) >= 0
+
+    def items(self, start=0, stop=None):
+        """ (token, count) pairs in sorted order """
+        stop = len(self) if stop is None else stop
+        for i in range(start, stop):
+            yield self.token(i), self._counts[i]
+
+    def keys(self):
+        for token, count in self.items():
+            yield token
+
+    def items_with_prefix(self, prefix):
+        """ (token, count) pairs of the tokens starting with prefix """
+        key = prefix.encode('utf-8')
+        i = self._search(key)
+        while i < len(self) and self._key(i).startswith(key):
+            yield self.token(i), self._counts[i]
+            i += 1
+
+    def to_tokens(self):
+        """ token dictionary, as returned by tokenize """
+        return dict(self.items())
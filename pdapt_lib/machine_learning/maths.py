@@ -4,12 +4,11 @@
 #
 #  For license information see license.txt
 
-import math, sys, os
-
-from pdapt_lib.basics.tco import TailCaller, TailCall, tailcall
+import math, operator, sys, os
 
 import numpy as np
 from functools import reduce
+from contextlib import contextmanager
 
 
 """ Maths module
@@ -19,16 +18,121 @@ from functools import reduce
      matrix
 """
 
-@TailCaller
-def factorial(n, acc=1):
-    """ simple factorial
-    Args: just n as using default args for accumulator.
-    here's a doc test:
+
+# backends: the vector and matrix functions below work on lists in pure
+# Python by default; with the numpy backend they take and return arrays,
+# and a 2-D array (a stack of vectors) is handled row by row in one call;
+# below about a hundred elements the pure Python functions are faster
+
+_numpy_backend = False
+
+
+def set_backend(name):
+    """ select 'python' (lists, the default) or 'numpy' (arrays) """
+    global _numpy_backend
+    if name not in ('python', 'numpy'):
+        raise ValueError("backend must be 'python' or 'numpy'")
+    _numpy_backend = name == 'numpy'
+
+
+def get_backend():
+    return 'numpy' if _numpy_backend else 'python'
+
+
+@contextmanager
+def using_backend(name):
+    """ select a backend for a with block
+    >>> with using_backend('numpy'):
+    ...     distance(np.array([[0, 0], [1, 1]]), np.array([[3, 4], [4, 5]])).tolist()
+    [5.0, 5.0]
+    """
+    previous = get_backend()
+    set_backend(name)
+    try:
+        yield
+    finally:
+        set_backend(previous)
+
+def range_product(lo, hi):
+    """ lo * (lo+1) * ... * (hi-1), exact
+    NB halves of similar size are multiplied (binary splitting), much
+       faster than multiplying in one at a time for long ranges
+    >>> range_product(5, 8)
+    210
+    """
+    if hi - lo <= 16:
+        result = 1
+        for i in range(lo, hi):
+            result *= i
+        return result
+    mid = (lo + hi) // 2
+    return range_product(lo, mid) * range_product(mid, hi)
+
+
+def _odd_product(lo, hi):
+    """ product of the odd numbers from lo up to hi, both odd, hi excluded """
+    count = (hi - lo) // 2
+    if count <= 8:
+        result = 1
+        for i in range(lo, hi, 2):
+            result *= i
+        return result
+    mid = lo + 2 * (count // 2)
+    return _odd_product(lo, mid) * _odd_product(mid, hi)
+
+
+_factorials = [1]
+for _i in range(1, 101):
+    _factorials.append(_factorials[-1] * _i)
+
+
+def factorial(n):
+    """ exact factorial
+    NB n! is 2**(n - number of ones in binary n) times the odd part, a
+       product over the odd numbers in (n/2**(i+1), n/2**i] for each i;
+       these odd products are built up by binary splitting, so the big
+       multiplications are between numbers of similar size.  Values up to
+       100! come from a table.
+    NB n must be an integer (int or numpy integer); floats such as 5.0,
+       accepted before, raise TypeError.
     >>> factorial(5)
     120
+    >>> factorial(0), len(str(factorial(1000)))
+    (1, 2568)
+    """
+    n = operator.index(n)
+    if n < 0:
+        raise ValueError("factorial of a negative number")
+    if n < len(_factorials):
+        return _factorials[n]
+    inner = outer = 1
+    for i in range(n.bit_length(), -1, -1):
+        lo, hi = ((n >> (i + 1)) + 1) | 1, ((n >> i) + 1) | 1
+        if hi > lo:
+            inner *= _odd_product(lo, hi)
+            outer *= inner
+    return outer << (n - bin(n).count('1'))
+
+
+def _lgamma(x):
+    """ log gamma of a number or, elementwise, of an array """
+    if np.ndim(x) == 0:
+        return math.lgamma(x)
+    try:
+        from scipy.special import gammaln
+    except ImportError:
+        return np.frompyfunc(math.lgamma, 1, 1)(np.asarray(x, dtype=np.float64)).astype(np.float64)
+    return gammaln(np.asarray(x, dtype=np.float64))
+
+
+def log_factorial(n):
+    """ natural log of n!, for numbers or arrays
+    >>> round(log_factorial(5), 10) == round(math.log(120), 10)
+    True
+    >>> log_factorial(np.array([0, 1, 10**6])).round(3).tolist()
+    [0.0, 0.0, 12815518.385]
     """
-    if n == 1: return acc
-    else: return tailcall(factorial)(n-1, n*acc)
+    return _lgamma(np.add(n, 1))
 
 
 def vector_add(v,w):
@@ -37,10 +141,14 @@ def vector_add(v,w):
     >>> vector_add([1,2,3],[1,2,3])
     [2, 4, 6]
     """
+    if _numpy_backend:
+        return np.add(v, w)
     return [v_i + w_i for v_i, w_i in zip(v,w)]
 
 def vector_subtract(v,w):
     """ subtract corresponding elements """
+    if _numpy_backend:
+        return np.subtract(v, w)
     return [v_i - w_i for v_i, w_i in zip(v,w)]
 
 
@@ -54,18 +162,29 @@ def dot(a,b):
     >>> dot([0,2.0,4],[0,1,1])
     6.0
     """
+    if _numpy_backend:
+        # row by row for stacks of vectors
+        return np.einsum('...i,...i->...', a, b)
     return sum(a_i * b_i for a_i, b_i in zip(a, b))
 
 
-def vector_sum(vectors):
+def vector_sum(vectors, componentwise=False):
     """ sum componentwise
+    NB by default the componentwise sum is then added up into one number;
+       componentwise=True returns the summed vector itself
     >>> vector_sum([[1,2,3],[1,2,3]])
     12
+    >>> vector_sum([[1,2,3],[1,2,3]], componentwise=True)
+    [2, 4, 6]
     """
+    if _numpy_backend:
+        return np.sum(vectors, axis=-2) if componentwise else np.sum(vectors)
     summed = vectors[0]
     vectors = vectors[1:]
     for v in vectors:
         summed = vector_add(summed,v)
+    if componentwise:
+        return summed
     return reduce(lambda acc,i: acc+i, summed)
 
 
@@ -75,14 +194,26 @@ def scalar_multiply(c, v):
     >>> scalar_multiply(10.0, [1,2,3])
     [10.0, 20.0, 30.0]
     """
+    if _numpy_backend:
+        return np.multiply(c, v)
     return list(map(lambda x: c*x, v))
 
 
-def vector_mean(vectors):
+def vector_mean(vectors, componentwise=False):
     """ compute the vector whose ith element is mean of the
-    ith elements of the input vectors"""
+    ith elements of the input vectors
+    NB only so with componentwise=True; by default vector_sum adds
+       everything up into one number, which scalar_multiply rejects, so
+       with either backend this is a TypeError
+    >>> vector_mean([[1,2,3],[3,4,5]], componentwise=True)
+    [2.0, 3.0, 4.0]
+    """
+    if not componentwise:
+        raise TypeError("vector_sum returns a number, use vector_mean(vectors, componentwise=True)")
+    if _numpy_backend:
+        return np.mean(vectors, axis=-2)
     n = len(vectors)
-    return scalar_multiply(1/n, vector_sum(vectors))
+    return scalar_multiply(1/n, vector_sum(vectors, componentwise))
 
 
 def sum_of_squares(v):
@@ -92,6 +223,8 @@ def sum_of_squares(v):
 
 def magnitude(v):
     """ this is the l2 norm """
+    if _numpy_backend:
+        return np.sqrt(sum_of_squares(v))
     return math.sqrt(sum_of_squares(v))
 
 def lp_norm(v,p):
@@ -135,10 +268,21 @@ def shape(A):
 def get_row(A,i): return A[i]
 
 
-def get_column(A,j): return [A_i[j] for A_i in A]
+def get_column(A,j):
+    if _numpy_backend:
+        return np.asarray(A)[..., j]
+    return [A_i[j] for A_i in A]
 
 
 def make_matrix(num_rows, num_cols, entry_fn):
+    """ matrix with entry_fn(i, j) in row i and column j
+    NB entry_fn is called for each entry, with either backend
+    >>> make_matrix(2, 3, lambda i, j: i + j)
+    [[0, 1, 2], [1, 2, 3]]
+    """
+    if _numpy_backend:
+        entries = np.frompyfunc(entry_fn, 2, 1).outer(np.arange(num_rows), np.arange(num_cols))
+        return np.array(entries.tolist()).reshape(num_rows, num_cols)
     return [[entry_fn(i,j) for j in range(num_cols)] for i in range(num_rows)]
 
 
@@ -191,6 +335,84 @@ def dihedral(a, b, c, d):
    return math.atan2(y,x) * 180.0/math.pi
 
 
+# batch geometry: every argument holds one point per frame (or bond, ...)
+# in its last axis, so N frames are a single call
+
+def _unit(v):
+    return v / np.sqrt(np.einsum('...i,...i->...', v, v))[..., None]
+
+
+def point_angles(a, b=None, c=None):
+    """ point_angle for arrays of points, in degrees
+    Input: a, b, c arrays (..., 3) of points, or a single array (..., 3, 3)
+           holding all three
+    Output: array (...) of angles at b
+
+    >>> a = np.array([[-2.975941,3.026175,-1.069039], [1.0, 0.0, 0.0]])
+    >>> b = np.array([[-3.318522,2.808196,0.810145], [0.0, 0.0, 0.0]])
+    >>> c = np.array([[-3.627889,4.656182,1.240712], [0.0, 1.0, 0.0]])
+    >>> np.round(point_angles(a, b, c), 10).tolist()
+    [97.9666134976, 90.0]
+    """
+    if b is None:
+        a, b, c = np.moveaxis(np.asarray(a, dtype=np.float64), -2, 0)
+    ba = np.subtract(a, b)
+    bc = np.subtract(c, b)
+    cosine = np.einsum('...i,...i->...', ba, bc) / np.sqrt(np.einsum('...i,...i->...', ba, ba)
+                                                           * np.einsum('...i,...i->...', bc, bc))
+    return np.arccos(np.clip(cosine, -1.0, 1.0)) * 180.0/math.pi
+
+
+def dihedrals(a, b=None, c=None, d=None):
+    """ dihedral for arrays of points, in degrees
+    Input: a, b, c, d arrays (..., 3) of points, or a single array
+           (..., 4, 3) holding all four
+    Output: array (...) of dihedral angles
+
+    >>> points = np.array([[[-2.975941,3.026175,-1.069039],[-3.318522,2.808196,0.810145],
+    ...                     [-3.627889,4.656182,1.240712],[-4.122107,4.795455,2.203724]]])
+    >>> np.round(dihedrals(points), 10).tolist()
+    [163.7538597052]
+    """
+    if b is None:
+        a, b, c, d = np.moveaxis(np.asarray(a, dtype=np.float64), -2, 0)
+    v1 = np.subtract(b, a)
+    v2 = np.subtract(b, c)
+    v3 = np.subtract(d, c)
+    n1 = _unit(np.cross(v1, v2))
+    n2 = _unit(np.cross(v2, v3))
+    x = np.einsum('...i,...i->...', n1, n2)
+    y = np.einsum('...i,...i->...', np.cross(n1, _unit(v2)), n2)
+    return np.arctan2(y, x) * 180.0/math.pi
+
+
+def angles_of(coordinates, indices):
+    """ angles of index triples into coordinates
+    Input: coordinates (..., atoms, 3), eg (frames, atoms, 3) for a
+           trajectory, and indices (K, 3) of atoms
+    Output: array (..., K) of point_angles
+
+    >>> coordinates = np.array([[[1.0, 0, 0], [0, 0, 0], [0, 1.0, 0], [1.0, 1.0, 0]]])
+    >>> angles_of(coordinates, [[0, 1, 2], [1, 0, 3]]).round(6).tolist()
+    [[90.0, 90.0]]
+    """
+    coordinates, indices = np.asarray(coordinates, dtype=np.float64), np.asarray(indices)
+    return point_angles(*(coordinates[..., indices[:, j], :] for j in range(3)))
+
+
+def dihedrals_of(coordinates, indices):
+    """ dihedral angles of index quadruples into coordinates
+    Input: coordinates (..., atoms, 3) and indices (K, 4) of atoms
+    Output: array (..., K) of dihedrals
+
+    >>> coordinates = np.array([[1.0, 0, 0], [0, 0, 0], [0, 1.0, 0], [0, 1.0, 1.0]])
+    >>> dihedrals_of(coordinates, [[0, 1, 2, 3]]).round(6).tolist()
+    [-90.0]
+    """
+    coordinates, indices = np.asarray(coordinates, dtype=np.float64), np.asarray(indices)
+    return dihedrals(*(coordinates[..., indices[:, j], :] for j in range(4)))
+
+
 def norm(x):
     """ returns the norm of a vector
     expects np ararry
@@ -358,6 +580,233 @@ def pearson_distance(x,y):
     return 1.0 - pearson
 
 
+### pairwise distances
+
+# every metric above as a formula over tiles of rows of X and Y: GEMM for
+# the cosine, euclidean and pearson families, a pass per feature for the
+# cityblock family and a sparse product of value incidence for the set
+# metrics; prepare works on all rows once, tile on slices of the result
+
+def _rows(X):
+    return (X,)
+
+
+def _normed(X):
+    """ rows, squared norms and unit rows """
+    squares = np.einsum('ij,ij->i', X, X)
+    return X, squares, X / np.sqrt(squares)[:, None]
+
+
+def _centred(X):
+    """ unit rows after removing the row means """
+    centred = X - X.mean(axis=1, keepdims=True)
+    return (centred / np.sqrt(np.einsum('ij,ij->i', centred, centred))[:, None],)
+
+
+def _value_sets(X, Y):
+    """ rows of X and Y as sparse 0/1 incidence of the distinct values """
+    from scipy import sparse
+    values, codes = np.unique(np.concatenate([X.ravel(), Y.ravel()]), return_inverse=True)
+    result = []
+    for start, Z in ((0, X), (X.size, Y)):
+        rows = np.repeat(np.arange(len(Z)), Z.shape[1])
+        incidence = sparse.csr_matrix((np.ones(Z.size), (rows, codes[start:start+Z.size])),
+                                      shape=(len(Z), len(values)))
+        incidence.data[:] = 1.0
+        result.append((incidence, incidence.getnnz(axis=1).astype(np.float64)))
+    return result
+
+
+def _euclidean_tile(a, b):
+    scale = a[1][:, None] + b[1][None, :]
+    squares = scale - 2.0 * np.dot(a[0], b[0].T)
+    # pairs much closer than their norms lose digits to cancellation,
+    # these are computed again from the differences
+    i, j = np.nonzero(squares < 1e-6 * scale)
+    difference = a[0][i] - b[0][j]
+    squares[i, j] = np.einsum('ij,ij->i', difference, difference)
+    return np.sqrt(np.maximum(squares, 0.0, out=squares))
+
+
+def _cosine_tile(a, b):
+    return 1.0 - np.dot(a[2], b[2].T)
+
+
+def _sigmoid_euclidean_tile(a, b):
+    return normalized_sigmoid(_euclidean_tile(a, b))
+
+
+def _by_feature(a, b, f):
+    """ sum of f(x, y, term) over the features, one feature at a time,
+    f writing into the term buffer
+    """
+    X, Y = a[0], b[0]
+    out = np.zeros((len(X), len(Y)))
+    term = np.empty_like(out)
+    for j in range(X.shape[1]):
+        out += f(X[:, j, None], Y[None, :, j], term)
+    return out
+
+
+def _absolute_difference(x, y, term):
+    return np.abs(np.subtract(x, y, out=term), out=term)
+
+
+def _absolute_sum(x, y, term):
+    return np.abs(np.add(x, y, out=term), out=term)
+
+
+def _canberra_term(x, y, term):
+    return np.divide(_absolute_difference(x, y, term), np.abs(x) + np.abs(y), out=term)
+
+
+def _intersections(a, b):
+    return np.asarray(a[0].dot(b[0].T).todense())
+
+
+_pairwise = {
+    'cosine': (_normed, _cosine_tile),
+    'euclidean': (_normed, _euclidean_tile),
+    'sigmoid_euclidean': (_normed, _sigmoid_euclidean_tile),
+    'alternative_euclidean': (_normed, lambda a, b: 1.0 - 1.0 / (1.0 + _euclidean_tile(a, b))),
+    'cosine_sigmoid_euclidean': (_normed, lambda a, b: (_cosine_tile(a, b) + _sigmoid_euclidean_tile(a, b)) / 2.0),
+    'pearson': (_centred, lambda a, b: 0.5 - 0.5 * np.dot(a[0], b[0].T)),
+    'cityblock': (_rows, lambda a, b: _by_feature(a, b, _absolute_difference)),
+    'braycurtis': (_rows, lambda a, b: _by_feature(a, b, _absolute_difference) / _by_feature(a, b, _absolute_sum)),
+    'canberra': (_rows, lambda a, b: _by_feature(a, b, _canberra_term)),
+    'jaccard': (_value_sets, lambda a, b: 1.0 - _intersections(a, b)
+                                          / (a[1][:, None] + b[1][None, :] - _intersections(a, b))),
+    'sorensen': (_value_sets, lambda a, b: 1.0 - 2.0 * _intersections(a, b) / (a[1][:, None] + b[1][None, :])),
+}
+
+_pairwise_functions = {
+    cosine_distance: 'cosine', euclidean_distance: 'euclidean', braycurtis_distance: 'braycurtis',
+    cityblock_distance: 'cityblock', canberra_distance: 'canberra', jaccard_distance: 'jaccard',
+    sorensen_distance: 'sorensen', sigmoid_euclidean_distance: 'sigmoid_euclidean',
+    alternative_euclidean_distance: 'alternative_euclidean',
+    cosine_sigmoid_euclidean_distance: 'cosine_sigmoid_euclidean', pearson_distance: 'pearson',
+}
+
+
+def _pairwise_engine(X, Y, metric):
+    """ prepared rows of X and Y and the tile function of a metric """
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    Y = X if Y is None else np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    if X.shape[1] != Y.shape[1]:
+        raise ValueError("X and Y must have the same number of columns")
+    metric = _pairwise_functions.get(metric, metric)
+    if metric in _pairwise:
+        prepare, tile = _pairwise[metric]
+    elif callable(metric):
+        # any other function of two vectors, one pair at a time
+        prepare = _rows
+        tile = lambda a, b: np.array([[metric(x, y) for y in b[0]] for x in a[0]], dtype=np.float64)
+    else:
+        raise ValueError("unknown metric %r, expected one of %s" % (metric, ", ".join(sorted(_pairwise))))
+    if metric == 'pearson' and X.shape[1] < 3:
+        prepare, tile = _rows, lambda a, b: np.zeros((len(a[0]), len(b[0])))
+    if prepare is _value_sets:
+        a, b = _value_sets(X, Y)
+    else:
+        a = prepare(X)
+        b = a if Y is X else prepare(Y)
+    return a, b, len(X), len(Y), tile
+
+
+def _run_tiles(tiles, threads):
+    """ call every tile function, on a thread pool unless threads == 1 """
+    if threads == 1:
+        for f in tiles:
+            f()
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(threads or os.cpu_count()) as pool:
+        for _ in pool.map(lambda f: f(), tiles):
+            pass
+
+
+def _output_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("dtype must be float32 or float64")
+    return dtype
+
+
+def pairwise_distances(X, Y=None, metric='euclidean', dtype=np.float64, block=1024, threads=None):
+    """ distances between all rows of X and all rows of Y
+    Input: (n, d) and (m, d) arrays (Y defaults to X), metric name (eg
+           'cosine', 'pearson', see _pairwise) or one of the distance
+           functions above, output dtype float32 or float64, rows per tile,
+           number of threads (default one per cpu)
+    Output: (n, m) array with metric(X[i], Y[j]) in row i and column j
+
+    NB tiles of block x block distances are computed in float64 (numpy
+       releases the GIL, so threads run tiles in parallel) and written into
+       the output; without Y and with a metric of _pairwise only tiles on
+       and above the diagonal are computed and mirrored (other functions
+       need not be symmetric).
+    NB euclidean distances come from |x|**2 + |y|**2 - 2 x.y, except for
+       pairs much closer than their norms, which are computed directly.
+    NB as with the functions above, jaccard and sorensen compare the sets
+       of values in each row, and canberra is nan where x and y are both 0.
+
+    >>> X = np.array([[2, 0, 1, 1, 1, 1, 1, 1, 1, 0], [1.9, 2, 2, 1, 1, 0, 0, 0, 1, 1]])
+    >>> Y = np.array([[0, 2, 2, 1, 1, 0, 0, 0, 1, 1], [2, 2, 2, 1, 1, 0, 0, 0, 1, 1]])
+    >>> pairwise_distances(X, Y, 'cityblock').tolist()
+    [[9.0, 7.0], [1.9, 0.10000000000000009]]
+    >>> D = pairwise_distances(X, Y, pearson_distance)
+    >>> bool(np.allclose(D[0, 1], pearson_distance(X[0], Y[1])))
+    True
+    >>> pairwise_distances(X, metric='jaccard', dtype=np.float32).tolist()
+    [[0.0, 0.25], [0.25, 0.0]]
+    """
+    dtype = _output_dtype(dtype)
+    symmetric = Y is None and _pairwise_functions.get(metric, metric) in _pairwise
+    a, b, n, m, tile = _pairwise_engine(X, Y, metric)
+    out = np.empty((n, m), dtype=dtype)
+
+    def compute(i, j):
+        def f():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                D = tile(tuple(p[i:i+block] for p in a), tuple(p[j:j+block] for p in b))
+            out[i:i+block, j:j+block] = D
+            if symmetric and i != j:
+                out[j:j+block, i:i+block] = D.T
+        return f
+
+    _run_tiles([compute(i, j) for i in range(0, n, block)
+                for j in range(i if symmetric else 0, m, block)], threads)
+    return out
+
+
+def iter_pairwise_distances(X, Y=None, metric='euclidean', dtype=np.float64, block=1024, threads=None):
+    """ pairwise_distances a block of rows at a time
+    Output: generator of (start, array of the distances of rows start to
+            start+block of X to all rows of Y)
+
+    NB for reductions over distance matrices too large to hold, such as
+       the nearest rows of Y to each row of X.
+
+    >>> X = np.array([[0.0, 0.0], [3.0, 4.0], [6.0, 8.0]])
+    >>> [(start, D.tolist()) for start, D in iter_pairwise_distances(X, X[:1], block=2)]
+    [(0, [[0.0], [5.0]]), (2, [[10.0]])]
+    """
+    dtype = _output_dtype(dtype)
+    a, b, n, m, tile = _pairwise_engine(X, Y, metric)
+    for i in range(0, n, block):
+        rows = tuple(p[i:i+block] for p in a)
+        out = np.empty((min(block, n - i), m), dtype=dtype)
+
+        def compute(j):
+            def f():
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    out[:, j:j+block] = tile(rows, tuple(p[j:j+block] for p in b))
+            return f
+
+        _run_tiles([compute(j) for j in range(0, m, block)], threads)
+        yield i, out
+
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+#  minhash.py
+#
+#  Author: Matthew K. MacLeod
+#
+#  For license information see license.txt
+
+""" MinHash
+
+  near duplicate detection with MinHash signatures and banded
+  locality sensitive hashing (LSH)
+
+"""
+from pdapt_lib.machine_learning.nlp import tokenize
+import numpy as np
+import zlib
+
+_prime = (1 << 32) - 5  # largest prime below 2**32
+
+
+def shingle_hashes(shingles):
+    """ stable 32 bit hashes of shingles
+    Input: iterable of strings, eg the keys of tokenize(s, n)
+    Output: array of unique uint64 hashes
+
+    NB crc32 is used rather than hash(), which differs between processes.
+
+    >>> shingle_hashes(['the rain', 'rain in', 'the rain']).tolist()
+    [1284541918, 4203718365]
+    """
+    return np.unique(np.array([zlib.crc32(s.encode('utf-8')) for s in shingles], dtype=np.uint64))
+
+
+class MinHash(object):
+    """ MinHash signatures of shingle sets
+    Input: number of hash functions (the signature length), random seed
+
+    NB the fraction of equal entries in two signatures estimates the
+       Jaccard similarity of the shingle sets, with standard error of
+       about 1/sqrt(num_perm).
+    NB signatures made with the same num_perm and seed can be compared and
+       merged, also between processes and shards.
+
+    >>> minhash = MinHash(num_perm=128)
+    >>> a = minhash.signature("the rain in Spain falls mainly on the plain", n=2)
+    >>> b = minhash.signature("the rain in Spain falls mainly on the hills", n=2)
+    >>> a.shape, a.dtype
+    ((128,), dtype('uint32'))
+    >>> round(MinHash.jaccard(a, b), 2)  # the exact similarity is 7/9
+    0.85
+    """
+    def __init__(self, num_perm=128, seed=1):
+        self.num_perm = num_perm
+        self.seed = seed
+        state = np.random.RandomState(seed)
+        # h(x) = (a*x + b) mod p, with a*x + b < 2**64 for x < p
+        self.a = state.randint(1, _prime, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.b = state.randint(0, _prime, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def signature(self, doc, n=1, block=4096):
+        """ signature of a document
+        Input: string doc (shingled as the keys of tokenize(doc, n)),
+               or a token dictionary or other iterable of shingles
+        Output: uint32 array of length num_perm
+        """
+        if isinstance(doc, str):
+            doc = tokenize(doc, n)
+        hashes = shingle_hashes(doc) % _prime
+        signature = np.full(self.num_perm, _prime, dtype=np.uint64)
+        for i in range(0, len(hashes), block):
+            h = (np.outer(self.a, hashes[i:i+block]) + self.b[:, None]) % _prime
+            np.minimum(signature, h.min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+    def signatures(self, docs, n=1):
+        """ (number of docs, num_perm) array of signatures """
+        signatures = np.empty((len(docs), self.num_perm), dtype=np.uint32)
+        for i, doc in enumerate(docs):
+            signatures[i] = self.signature(doc, n)
+        return signatures
+
+    @staticmethod
+    def jaccard(a, b):
+        """ estimated Jaccard similarity of two signatures """
+        return float(np.mean(a == b))
+
+    @staticmethod
+    def union(a, b):
+        """ signature of the union of two shingle sets """
+        return np.minimum(a, b)
+
+
+def lsh_parameters(threshold, num_perm):
+    """ bands and rows per band for a Jaccard threshold
+    Input: threshold similarity, signature length
+    Output: (bands, rows) with bands*rows <= num_perm
+
+    NB documents with similarity s share a band with probability
+       1 - (1 - s**rows)**bands, an S curve which is steepest near
+       (1/bands)**(1/rows); the pair closest to the threshold is taken.
+
+    >>> lsh_parameters(0.8, 128)
+    (11, 11)
+    >>> lsh_parameters(0.5, 128)
+    (25, 5)
+    """
+    best = None
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1:]
+
+
+class LSHIndex(object):
+    """ banded LSH index of MinHash signatures
+    Input: Jaccard threshold, signature length, optional bands and rows
+
+    NB every signature is cut into bands, and documents with an identical
+       band land in the same bucket; only documents sharing a bucket are
+       compared, so finding near duplicates is roughly linear in the number
+       of documents.
+
+    >>> minhash = MinHash()
+    >>> docs = ["the rain in Spain falls mainly on the plain",
+    ...         "the rain in Spain falls mainly on the plains",
+    ...         "a simple version of a tokenizer"]
+    >>> index = LSHIndex(0.5)
+    >>> for i, doc in enumerate(docs):
+    ...     index.add(i, minhash.signature(doc, n=2))
+    >>> [(a, b) for a, b, similarity in index.near_duplicates()]
+    [(0, 1)]
+    >>> index.query(minhash.signature("the rain in Spain falls mainly on the hills", n=2))
+    [0, 1]
+    """
+    def __init__(self, threshold=0.8, num_perm=128, bands=None, rows=None):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        if bands is None or rows is None:
+            bands, rows = lsh_parameters(threshold, num_perm)
+        if bands * rows > num_perm:
+            raise ValueError("bands * rows must not exceed num_perm")
+        self.bands, self.rows = bands, rows
+        self.keys = []
+        self._signatures = []
+        self.buckets = [{} for _ in range(bands)]
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [signature[i*r:(i+1)*r].tobytes() for i in range(self.bands)]
+
+    def add(self, key, signature):
+        """ index a signature under a key (eg the position or name of a document) """
+        if len(signature) != self.num_perm:
+            raise ValueError("expected a signature of length %d" % self.num_perm)
+        signature = np.asarray(signature, dtype=np.uint32)
+        i = len(self.keys)
+        self.keys.append(key)
+        self._signatures.append(signature)
+        for bucket, band in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(band, []).append(i)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def signatures(self):
+        """ (number of documents, num_perm) array of the indexed signatures """
+        if not self._signatures:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        if len(self._signatures) > 1:
+            self._signatures = [np.vstack(self._signatures)]
+        return self._signatures[0].reshape(-1, self.num_perm)
+
+    def candidates(self):
+        """ set of index pairs (i, j), i < j, sharing at least one bucket """
+        pairs = set()
+        for bucket in self.buckets:
+            for members in bucket.values():
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        pairs.add((members[x], members[y]))
+        return pairs
+
+    def near_duplicates(self, threshold=None):
+        """ sorted list of (key, key, estimated similarity) for candidate
+        pairs at or above the threshold
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signatures = self.signatures
+        result = []
+        for i, j in sorted(self.candidates()):
+            similarity = MinHash.jaccard(signatures[i], signatures[j])
+            if similarity >= threshold:
+                result.append((self.keys[i], self.keys[j], similarity))
+        return result
+
+    def query(self, signature):
+        """ keys of indexed documents sharing a bucket with signature """
+        found = set()
+        for bucket, band in zip(self.buckets, self._band_keys(np.asarray(signature, dtype=np.uint32))):
+            found.update(bucket.get(band, ()))
+        return [self.keys[i] for i in sorted(found)]
+
+    def merge(self, other):
+        """ add the documents of another index with the same parameters """
+        if (other.num_perm, other.bands, other.rows) != (self.num_perm, self.bands, self.rows):
+            raise ValueError("can only merge indexes with the same num_perm, bands and rows")
+        for key, signature in zip(other.keys, other.signatures):
+            self.add(key, signature)
+        return self
+
+    def save(self, path):
+        """ store keys, signatures and parameters in a NumPy .npz file """
+        np.savez(path, keys=np.array(self.keys), signatures=self.signatures,
+                 parameters=np.array([self.threshold, self.num_perm, self.bands, self.rows]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            threshold, num_perm, bands, rows = data['parameters'].tolist()
+            index = cls(threshold, int(num_perm), int(bands), int(rows))
+            for key, signature in zip(data['keys'].tolist(), data['signatures']):
+                index.add(key, signature)
+        return index
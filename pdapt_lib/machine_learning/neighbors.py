@@ -0,0 +1,459 @@
+#  neighbors.py
+#
+#  Author: Matthew K. MacLeod
+#
+#  For license information see license.txt
+
+""" Nearest neighbors
+
+  k nearest neighbor and radius queries against a fixed set of vectors,
+  with a KD-tree, a ball tree or brute force over maths.pairwise_distances
+
+  the trees index vectors under the euclidean or cityblock distance;
+  metrics of maths that only rescale one of these after a transformation
+  of the vectors are supported by the trees as well:
+
+    sigmoid_euclidean, alternative_euclidean   increasing in euclidean
+    cosine     euclidean**2 / 2 between the vectors scaled to unit length
+    pearson    euclidean**2 / 4 between the unit length centred vectors
+
+  the remaining metrics (braycurtis, canberra, jaccard, sorensen,
+  cosine_sigmoid_euclidean) and other functions need BruteForce
+
+"""
+from pdapt_lib.machine_learning.maths import pairwise_distances, normalized_sigmoid, _pairwise_functions
+import numpy as np
+
+
+def _unit_rows(X):
+    return X / np.sqrt(np.einsum('ij,ij->i', X, X))[:, None]
+
+
+def _centred_unit_rows(X):
+    return _unit_rows(X - X.mean(axis=1, keepdims=True))
+
+
+# metric: (transformation of the vectors, distance of the tree, the metric
+#          as a function of that distance, and its inverse for radii)
+_tree_metrics = {
+    'euclidean': (None, 'euclidean', None, None),
+    'cityblock': (None, 'cityblock', None, None),
+    'sigmoid_euclidean': (None, 'euclidean', normalized_sigmoid,
+                          lambda r: 2.0 * np.log((1.0 + r) / (1.0 - r)) if r < 1 else np.inf),
+    'alternative_euclidean': (None, 'euclidean', lambda d: d / (1.0 + d),
+                              lambda r: r / (1.0 - r) if r < 1 else np.inf),
+    'cosine': (_unit_rows, 'euclidean', lambda d: d * d / 2.0, lambda r: np.sqrt(2.0 * max(r, 0.0))),
+    'pearson': (_centred_unit_rows, 'euclidean', lambda d: d * d / 4.0, lambda r: 2.0 * np.sqrt(max(r, 0.0))),
+}
+
+
+def _metric_name(metric):
+    return _pairwise_functions.get(metric, metric)
+
+
+def _length(difference, distance):
+    """ euclidean or cityblock length along the last axis """
+    if distance == 'euclidean':
+        return np.sqrt(np.einsum('...i,...i->...', difference, difference))
+    return np.abs(difference).sum(axis=-1)
+
+
+def _top_k(q, d, i, nq, k):
+    """ the k smallest distances of each query among (query, distance,
+    index) entries, each query having at least k entries
+    """
+    order = np.lexsort((d, q))
+    q, d, i = q[order], d[order], i[order]
+    rank = np.arange(len(q)) - np.searchsorted(q, q)
+    keep = rank < k
+    return d[keep].reshape(nq, k), i[keep].reshape(nq, k)
+
+
+def _in_batches(f, X, batch, threads):
+    """ f over batches of rows of X, on a thread pool unless threads == 1 """
+    batches = [X[i:i+batch] for i in range(0, len(X), batch)]
+    if threads == 1:
+        return [f(B) for B in batches]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(f, batches))
+
+
+class _Tree(object):
+    """ balanced binary tree over a permuted copy of the vectors
+
+    NB node i has children 2i+1 and 2i+2 and holds the points
+       data[start[i]:end[i]]; every leaf is at the same depth.  Nodes are
+       split at the median of their widest coordinate.
+    NB vectors whose distances are undefined (nan), such as zero vectors
+       for cosine or constant ones for pearson, are kept out of the tree;
+       as with BruteForce they are never within a radius and come last,
+       with nan distances, when k exceeds the other vectors.
+    """
+    _arrays = ('data', 'index', 'start', 'end', 'excluded')
+    _bounds = ()
+
+    def __init__(self, data, metric='euclidean', leaf_size=40):
+        self.metric = _metric_name(metric)
+        if self.metric not in _tree_metrics:
+            raise ValueError("metric %r is not supported by the trees, use BruteForce" % (metric,))
+        data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+        if self.metric == 'pearson' and data.shape[1] < 3:
+            raise ValueError("pearson needs vectors of at least 3 elements, use BruteForce")
+        if leaf_size < 1:
+            raise ValueError("leaf_size must be at least 1")
+        self.leaf_size = leaf_size
+        transform = _tree_metrics[self.metric][0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            points = transform(data) if transform else data
+        usable = np.isfinite(points).all(axis=1)
+        if not usable.any():
+            raise ValueError("no vectors with defined distances to index")
+        self.excluded = np.flatnonzero(~usable)
+        indexed, points = np.flatnonzero(usable), points[usable]
+        n = len(points)
+        self.depth = 0
+        while (n >> (self.depth + 1)) >= leaf_size:
+            self.depth += 1
+        nodes = (1 << (self.depth + 1)) - 1
+        self.start, self.end = np.zeros(nodes, dtype=np.intp), np.zeros(nodes, dtype=np.intp)
+        self.end[0] = n
+        self.index = np.arange(n)
+        for i in range((1 << self.depth) - 1):
+            s, e = self.start[i], self.end[i]
+            mid = (s + e) // 2
+            members = self.index[s:e]
+            coordinates = points[members]
+            widest = np.argmax(coordinates.max(axis=0) - coordinates.min(axis=0))
+            self.index[s:e] = members[np.argpartition(coordinates[:, widest], mid - s)]
+            self.start[2*i+1], self.end[2*i+1] = s, mid
+            self.start[2*i+2], self.end[2*i+2] = mid, e
+        self.data = points[self.index]
+        self.index = indexed[self.index]
+        self._build_bounds()
+        for name in self._arrays + self._bounds:
+            getattr(self, name).flags.writeable = False
+
+    @property
+    def distance(self):
+        return _tree_metrics[self.metric][1]
+
+    def __len__(self):
+        return len(self.data) + len(self.excluded)
+
+    def _level(self, l):
+        """ first node and number of nodes at depth l """
+        return (1 << l) - 1, 1 << l
+
+    def _points_of(self, nodes, distance_to):
+        """ (len(nodes), largest node) positions of the points of nodes and
+        their distances to the rows of distance_to, inf beyond each node
+        """
+        size = int((self.end[nodes] - self.start[nodes]).max())
+        positions = self.start[nodes][:, None] + np.arange(size)
+        beyond = positions >= self.end[nodes][:, None]
+        positions[beyond] = self.start[nodes][:, None].repeat(size, axis=1)[beyond]
+        d = _length(self.data[positions] - distance_to[:, None, :], self.distance)
+        d[beyond] = np.inf
+        return positions, d
+
+    def _transform(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if X.shape[1] != self.data.shape[1]:
+            raise ValueError("expected vectors of %d elements" % self.data.shape[1])
+        transform = _tree_metrics[self.metric][0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return transform(X) if transform else X
+
+    def _to_metric(self, d):
+        to_metric = _tree_metrics[self.metric][2]
+        return to_metric(d) if to_metric else d
+
+    def query(self, X, k=1, batch=1024, threads=1):
+        """ k nearest neighbors of each row of X
+        Input: (m, d) array, k, rows per batch, threads working on batches
+        Output: (m, k) arrays of distances and of indices of the vectors,
+                nearest first
+
+        NB each query descends to the deepest node holding at least k
+           points, whose k-th nearest point bounds the distance; nodes are
+           then visited level by level for all queries at once, skipping
+           nodes that cannot be nearer than the bound, and leaves are
+           searched in order of their distance, tightening the bound.
+        """
+        if not 1 <= k <= len(self):
+            raise ValueError("k must be between 1 and the number of vectors")
+        indexed = min(k, len(self.data))
+        results = _in_batches(lambda Q: self._query(Q, indexed), self._transform(X), batch, threads)
+        distances = np.vstack([d for d, i in results]) if results else np.zeros((0, indexed))
+        indices = np.vstack([i for d, i in results]) if results else np.zeros((0, indexed), dtype=np.intp)
+        if k > indexed:
+            rest = np.broadcast_to(self.excluded[:k - indexed], (len(indices), k - indexed))
+            distances = np.hstack([distances, np.full(rest.shape, np.nan)])
+            indices = np.hstack([indices, rest])
+        return self._to_metric(distances), indices
+
+    def _query(self, Q, k):
+        nq = len(Q)
+        queries = np.arange(nq)
+        level = 0
+        while level < self.depth and (len(self.data) >> (level + 1)) >= k:
+            level += 1
+        # the first bound, from the points of a nearby node
+        nodes = np.zeros(nq, dtype=np.intp)
+        for l in range(level):
+            left = 2 * nodes + 1
+            nodes = np.where(self._nearness(Q, left) <= self._nearness(Q, left + 1), left, left + 1)
+        home = nodes
+        positions, d = self._points_of(home, Q)
+        best_d, best_i = _top_k(np.repeat(queries, d.shape[1]), d.ravel(), positions.ravel(), nq, k)
+        # the nodes that may hold nearer points, down to the leaves
+        q, nodes = queries, np.zeros(nq, dtype=np.intp)
+        for l in range(self.depth + 1):
+            bound = self._lower_bound(Q[q], nodes)
+            keep = bound < best_d[q, -1]
+            if l >= level:
+                keep &= ((nodes + 1) >> (l - level)) - 1 != home[q]
+            q, nodes, bound = q[keep], nodes[keep], bound[keep]
+            if l < self.depth:
+                q, nodes = np.repeat(q, 2), (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+        order = np.argsort(bound, kind='stable')
+        q, nodes, bound = q[order], nodes[order], bound[order]
+        chunk = max(1, 4096 // k)
+        for i in range(0, len(q), chunk):
+            keep = bound[i:i+chunk] < best_d[q[i:i+chunk], -1]
+            cq, cnodes = q[i:i+chunk][keep], nodes[i:i+chunk][keep]
+            if not len(cq):
+                continue
+            positions, d = self._points_of(cnodes, Q[cq])
+            best_d, best_i = _top_k(np.concatenate([np.repeat(queries, k), np.repeat(cq, d.shape[1])]),
+                                    np.concatenate([best_d.ravel(), d.ravel()]),
+                                    np.concatenate([best_i.ravel(), positions.ravel()]), nq, k)
+        return best_d, self.index[best_i]
+
+    def query_radius(self, X, r, batch=1024, threads=1):
+        """ the vectors within distance r of each row of X
+        Output: lists with an array of distances and an array of indices
+                for each row of X, nearest first
+        """
+        inverse = _tree_metrics[self.metric][3]
+        radius = inverse(r) if inverse else r
+        results = _in_batches(lambda Q: self._query_radius(Q, radius), self._transform(X), batch, threads)
+        distances = [self._to_metric(d) for ds, i in results for d in ds]
+        indices = [i for ds, i_s in results for i in i_s]
+        return distances, indices
+
+    def _query_radius(self, Q, radius):
+        nq = len(Q)
+        q, nodes = np.arange(nq), np.zeros(nq, dtype=np.intp)
+        for l in range(self.depth + 1):
+            keep = self._lower_bound(Q[q], nodes) <= radius
+            q, nodes = q[keep], nodes[keep]
+            if l < self.depth:
+                q, nodes = np.repeat(q, 2), (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+        found_q, found_d, found_i = [np.zeros(0, dtype=np.intp)], [np.zeros(0)], [np.zeros(0, dtype=np.intp)]
+        chunk = max(1, 4096 // max(1, self.leaf_size))
+        for i in range(0, len(q), chunk):
+            positions, d = self._points_of(nodes[i:i+chunk], Q[q[i:i+chunk]])
+            inside = d <= radius
+            found_q.append(np.repeat(q[i:i+chunk], d.shape[1])[inside.ravel()])
+            found_d.append(d[inside])
+            found_i.append(positions[inside])
+        q, d, i = np.concatenate(found_q), np.concatenate(found_d), np.concatenate(found_i)
+        order = np.lexsort((d, q))
+        q, d, i = q[order], d[order], self.index[i[order]]
+        bounds = np.searchsorted(q, np.arange(nq + 1))
+        return ([d[a:b] for a, b in zip(bounds[:-1], bounds[1:])],
+                [i[a:b] for a, b in zip(bounds[:-1], bounds[1:])])
+
+    def save(self, path):
+        """ store the tree in a NumPy .npz file, nothing is rebuilt by load """
+        arrays = dict((name, getattr(self, name)) for name in self._arrays + self._bounds)
+        np.savez(path, metric=np.array(self.metric), parameters=np.array([self.leaf_size, self.depth]), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        tree = cls.__new__(cls)
+        with np.load(path) as data:
+            tree.metric = str(data['metric'])
+            tree.leaf_size, tree.depth = data['parameters'].tolist()
+            for name in cls._arrays + cls._bounds:
+                setattr(tree, name, data[name])
+                getattr(tree, name).flags.writeable = False
+        return tree
+
+
+class KDTree(_Tree):
+    """ KD-tree, for vectors of up to about 15 elements
+    Input: (n, d) array of vectors, metric (see module docstring), number
+           of points below which nodes are not split
+
+    NB nodes are bounded by boxes, the lower bound of the distance to a
+       node is the distance to its box.
+    NB queries do not change the tree, so one tree can serve queries from
+       many threads, and pickles or save/load give it to other processes.
+
+    >>> tree = KDTree(np.array([[0.0, 0.0], [1.0, 1.0], [2.0, 2.0], [3.0, 3.0]]), leaf_size=1)
+    >>> distances, indices = tree.query(np.array([[0.9, 1.2], [3.0, 2.2]]), k=2)
+    >>> indices.tolist()
+    [[1, 2], [3, 2]]
+    >>> distances.round(3).tolist()
+    [[0.224, 1.36], [0.8, 1.02]]
+    >>> distances, indices = tree.query_radius(np.array([[0.0, 0.5]]), 1.2)
+    >>> indices[0].tolist(), distances[0].round(3).tolist()
+    ([0, 1], [0.5, 1.118])
+    """
+    _bounds = ('lower', 'upper')
+
+    def _build_bounds(self):
+        first, count = self._level(self.depth)
+        leaves = self.start[first:first+count]
+        self.lower = np.empty((len(self.start), self.data.shape[1]))
+        self.upper = np.empty_like(self.lower)
+        self.lower[first:] = np.minimum.reduceat(self.data, leaves, axis=0)
+        self.upper[first:] = np.maximum.reduceat(self.data, leaves, axis=0)
+        for i in range(first - 1, -1, -1):
+            self.lower[i] = np.minimum(self.lower[2*i+1], self.lower[2*i+2])
+            self.upper[i] = np.maximum(self.upper[2*i+1], self.upper[2*i+2])
+
+    def _lower_bound(self, Q, nodes):
+        outside = np.maximum(self.lower[nodes] - Q, 0.0) + np.maximum(Q - self.upper[nodes], 0.0)
+        return _length(outside, self.distance)
+
+    _nearness = _lower_bound
+
+
+class BallTree(_Tree):
+    """ ball tree, for vectors of more elements than suit a KD-tree
+    Input: as KDTree
+
+    NB nodes are bounded by balls around the mean of their points, the
+       lower bound of the distance to a node is the distance to its center
+       less its radius.
+
+    >>> tree = BallTree(np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0], [-1.0, 0.2]]), 'cosine', leaf_size=1)
+    >>> distances, indices = tree.query(np.array([[2.0, 0.1]]), k=2)
+    >>> indices.tolist(), distances.round(4).tolist()
+    ([[0, 2]], [[0.0012, 0.2585]])
+    """
+    _bounds = ('centers', 'radius')
+
+    def _build_bounds(self):
+        nodes = len(self.start)
+        self.centers = np.empty((nodes, self.data.shape[1]))
+        self.radius = np.empty(nodes)
+        for l in range(self.depth + 1):
+            first, count = self._level(l)
+            starts, sizes = self.start[first:first+count], self.end[first:first+count] - self.start[first:first+count]
+            centers = np.add.reduceat(self.data, starts, axis=0) / sizes[:, None]
+            d = _length(self.data - np.repeat(centers, sizes, axis=0), self.distance)
+            self.centers[first:first+count] = centers
+            self.radius[first:first+count] = np.maximum.reduceat(d, starts)
+
+    def _lower_bound(self, Q, nodes):
+        return np.maximum(self._nearness(Q, nodes) - self.radius[nodes], 0.0)
+
+    def _nearness(self, Q, nodes):
+        # overlapping balls may both hold a query, the nearer center is
+        # the better guess of the child holding its nearest neighbors
+        return _length(Q - self.centers[nodes], self.distance)
+
+
+class BruteForce(object):
+    """ nearest neighbors by computing all distances, for any metric
+    Input: (n, d) array of vectors, metric as for maths.pairwise_distances
+
+    NB distances to a batch of queries are computed for block vectors at a
+       time, keeping the k nearest so far, so memory is batch x block.
+
+    >>> index = BruteForce(np.array([[2, 0, 1, 1], [0, 2, 2, 1], [1, 1, 1, 1]]), 'braycurtis')
+    >>> distances, indices = index.query(np.array([[2, 0, 1, 1]]), k=2)
+    >>> indices.tolist(), distances.round(4).tolist()
+    ([[0, 2]], [[0.0, 0.25]])
+    """
+    def __init__(self, data, metric='euclidean', block=16384):
+        self.metric = _metric_name(metric)
+        self.data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+        self.data.flags.writeable = False
+        self.block = block
+
+    def __len__(self):
+        return len(self.data)
+
+    def _distances(self, Q):
+        """ generator of (first index, distances from Q to a block of vectors) """
+        for j in range(0, len(self.data), self.block):
+            yield j, pairwise_distances(Q, self.data[j:j+self.block], self.metric, threads=1)
+
+    def query(self, X, k=1, batch=256, threads=1):
+        """ k nearest neighbors of each row of X, as KDTree.query """
+        if not 1 <= k <= len(self):
+            raise ValueError("k must be between 1 and the number of vectors")
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        results = _in_batches(lambda Q: self._query(Q, k), X, batch, threads)
+        distances = np.vstack([d for d, i in results]) if results else np.zeros((0, k))
+        indices = np.vstack([i for d, i in results]) if results else np.zeros((0, k), dtype=np.intp)
+        return distances, indices
+
+    def _query(self, Q, k):
+        best_d = np.full((len(Q), 0), np.inf)
+        best_i = np.zeros((len(Q), 0), dtype=np.intp)
+        rows = np.arange(len(Q))[:, None]
+        for j, D in self._distances(Q):
+            d = np.hstack([best_d, D])
+            i = np.hstack([best_i, np.broadcast_to(np.arange(j, j + D.shape[1]), D.shape)])
+            if d.shape[1] > k:
+                nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+                d, i = d[rows, nearest], i[rows, nearest]
+            best_d, best_i = d, i
+        order = np.argsort(best_d, axis=1, kind='stable')
+        return best_d[rows, order], best_i[rows, order]
+
+    def query_radius(self, X, r, batch=256, threads=1):
+        """ the vectors within distance r of each row of X, as KDTree.query_radius """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        results = _in_batches(lambda Q: self._query_radius(Q, r), X, batch, threads)
+        return [d for ds, i in results for d in ds], [i for ds, i_s in results for i in i_s]
+
+    def _query_radius(self, Q, r):
+        found = [[] for _ in range(len(Q))]
+        for j, D in self._distances(Q):
+            q, i = np.nonzero(D <= r)
+            for row, column in zip(q.tolist(), i.tolist()):
+                found[row].append((D[row, column], j + column))
+        distances, indices = [], []
+        for pairs in found:
+            pairs.sort()
+            distances.append(np.array([d for d, i in pairs]))
+            indices.append(np.array([i for d, i in pairs], dtype=np.intp))
+        return distances, indices
+
+    def save(self, path):
+        if not isinstance(self.metric, str):
+            raise ValueError("only indexes with a named metric can be saved")
+        np.savez(path, data=self.data, metric=np.array(self.metric), block=np.array(self.block))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['data'], str(data['metric']), int(data['block']))
+
+
+def nearest_neighbors(data, metric='euclidean', leaf_size=40):
+    """ index suiting the metric and the number of elements of the vectors
+    Input: (n, d) array of vectors, metric as for maths.pairwise_distances
+    Output: a KDTree up to 15 elements, a BallTree up to 40, otherwise (or
+            for metrics the trees do not support) BruteForce
+
+    >>> index = nearest_neighbors(np.random.RandomState(0).normal(size=(100, 3)))
+    >>> type(index).__name__, index.query(index.data[:1], k=1)[0].tolist()
+    ('KDTree', [[0.0]])
+    """
+    data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+    d = data.shape[1]
+    metric = _metric_name(metric)
+    if metric not in _tree_metrics or (metric == 'pearson' and d < 3) or d > 40:
+        return BruteForce(data, metric)
+    if d <= 15:
+        return KDTree(data, metric, leaf_size)
+    return BallTree(data, metric, leaf_size)
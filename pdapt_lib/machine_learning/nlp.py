@@ -11,9 +11,11 @@
 """
 from pdapt_lib.machine_learning.maths import sum_of_squares, dot, factorial
 import re
-from collections import defaultdict
-from functools import reduce
+from collections import defaultdict, deque
+from functools import reduce, lru_cache
+from itertools import islice
 import math
+import numpy as np
 
 
 # processing
@@ -63,6 +65,37 @@ def hamming_distance(s,t):
     return sum(1 for a, b in zip(s,t) if a != b)
 
 
+# contractions in the order expand applies them; every pattern holds exactly
+# one apostrophe and no replacement holds any, so each substitution is
+# anchored to an apostrophe of the input text
+_contractions = [(re.compile(p), r) for p, r in [
+    (r"[Ii]t's", 'it is'), # this will remove capitalized It
+    (r"'ve", ' have'),
+    (r"n't", ' not'),
+    (r"'ll", ' will'),
+    (r"'m", ' am'),
+    (r"'re", ' are'),
+    (r"'tis", 'it is'),
+    (r"'twas", 'it was'),
+    (r"let's", 'let us'),
+    (r"shan't", 'shall not'),
+    (r"G'day", 'Good day'),
+    # since can be possesive cant make this general
+    (r"who's", 'who is'),
+    (r"where's", 'where is'),
+    (r"what's", 'what is'),
+    (r"why's", 'why is'),
+    (r"that's", 'that is'),
+    (r"there's", 'there is'),
+    (r"someone's", 'someone is'),
+    (r"somebody's", 'somebody is'),
+    (r"something's", 'something is'),
+    (r"he's", 'he is'), # this could be dangerous
+    (r"o'clock", 'of the clock'),
+    (r"ain't", 'am not'),
+    ]]
+
+
 def expand(s):
     """ expand common contractions
     Input: string s
@@ -75,30 +108,8 @@ def expand(s):
     >>> expand("you're going to be amazed")
     'you are going to be amazed'
     """
-    s = re.sub(r'[Ii]t\'s', 'it is', s) # this will remove capitalized It
-    s = re.sub(r'\'ve', ' have', s)
-    s = re.sub(r'n\'t', ' not',s)
-    s = re.sub(r'\'ll', ' will',s)
-    s = re.sub(r'\'m', ' am', s)
-    s = re.sub(r'\'re', ' are', s)
-    s = re.sub(r'\'tis', 'it is',s)
-    s = re.sub(r'\'twas', 'it was',s)
-    s = re.sub(r'let\'s', 'let us', s)
-    s = re.sub(r'shan\'t', 'shall not', s)
-    s = re.sub(r'G\'day', 'Good day', s)
-    # since can be possesive cant make this general
-    s = re.sub(r'who\'s', 'who is',s)
-    s = re.sub(r'where\'s', 'where is',s)
-    s = re.sub(r'what\'s', 'what is',s)
-    s = re.sub(r'why\'s', 'why is',s)
-    s = re.sub(r'that\'s', 'that is',s)
-    s = re.sub(r'there\'s', 'there is', s)
-    s = re.sub(r'someone\'s', 'someone is',s)
-    s = re.sub(r'somebody\'s', 'somebody is',s)
-    s = re.sub(r'something\'s', 'something is',s)
-    s = re.sub(r'he\'s', 'he is',s) # this could be dangerous
-    s = re.sub(r'o\'clock', 'of the clock',s)
-    s = re.sub(r'ain\'t', 'am not', s)
+    for pattern, replacement in _contractions:
+        s = pattern.sub(replacement, s)
     return s
 
 
@@ -198,27 +209,67 @@ def find_sentence_end(s):
     return None
 
 
+_terminators = re.compile(r'[.!?]')
+_maybe_upper = re.compile(r'[A-Z]|[^\x00-\x7f]')
+
+
+def iter_sentences(text, offsets=False):
+    """ lazily extract sentences from text
+    Input: string text, offsets to yield (start, end) instead of strings
+    Output: generator of sentence strings or of their slice bounds in text
+
+    NB same rules and output as extract_sentences (see find_sentence_start and
+       find_sentence_end), but the text is scanned once, left to right, and
+       never copied, so long documents are fine.
+    NB like extract_sentences, a sentence can carry on past its terminator:
+       the end is measured from the end of the previous sentence.
+
+    >>> list(iter_sentences("I'm a sentence. Me too! And me?"))
+    ["I'm a sentence.", 'Me too! ', 'And me?']
+    >>> list(iter_sentences("I'm a sentence. Me too! And me?", offsets=True))
+    [(0, 15), (16, 24), (24, 31)]
+    """
+    n = len(text)
+    start = end = -1
+    position = 0
+    while True:
+        # first sentence start at or after position
+        if start < position:
+            m = _maybe_upper.search(text, position)
+            while m and not (text[m.start()].isupper() and text[m.start()+1:m.start()+2] != '.'):
+                m = _maybe_upper.search(text, m.start() + 1)
+            if m is None:
+                return
+            start = m.start()
+        # first sentence end at or after position
+        if end < position:
+            m = _terminators.search(text, position)
+            while m and not (m.start() == n - 1 or
+                             (m.start() < n - 2 and text[m.start()+1] == ' ' and text[m.start()+2].isupper())):
+                m = _terminators.search(text, m.start() + 1)
+            if m is None:
+                return
+            end = m.start()
+        stop = min(start + end - position + 1, n)
+        yield (start, stop) if offsets else text[start:stop]
+        position = stop
+
+
 def extract_sentences(text, sentences=None):
-    """ recursively extract sentences from text
+    """ extract sentences from text
     Input: string text s
     Output: list of sentence strings
 
+    NB see iter_sentences to work through a long text lazily
+
     >>> extract_sentences("I'm a sentence. Me too! And me?")
     ["I'm a sentence.", 'Me too! ', 'And me?']
     >>> extract_sentences("I understand acronyms like the U.S. and others. Good job!")
     ['I understand acronyms like the U.S. and others.', 'Good job!']
     """
     if sentences is None: sentences = []
-    start_position = find_sentence_start(text)
-    end_position = find_sentence_end(text)
-    if start_position == None or end_position == None:
-        return sentences
-    else:
-        text = text[start_position:]
-        sentence = text[0:end_position+1]
-        sentences.append(sentence)
-        text = text[end_position+1:]
-        return extract_sentences(text,sentences)
+    sentences.extend(iter_sentences(text))
+    return sentences
 
 
 def lowercase(s):
@@ -313,51 +364,136 @@ def remove_string_punctuation(text):
     import string
     return "".join(i for i in text if i not in string.punctuation)
 
+
+STOPWORDS = frozenset(["a", "about", "above", "above", "across", "after", "afterwards", "again",
+                       "against", "all", "almost", "alone", "along", "already", "also","although",
+                       "always","am","among", "amongst", "amoungst", "amount",  "an", "and", "another",
+                       "any","anyhow","anyone","anything","anyway", "anywhere", "are", "around", "as",
+                       "at", "back","be","became", "because","become","becomes", "becoming", "been",
+                       "before", "beforehand", "behind", "being", "below", "beside", "besides",
+                       "between", "beyond", "bill", "both", "bottom","but", "by", "call", "can",
+                       "cannot", "cant", "co", "con", "could", "couldnt", "cry", "de", "describe",
+                       "detail", "do", "done", "down", "due", "during", "each", "eg", "eight", "either",
+                       "eleven","else", "elsewhere", "empty", "enough", "etc", "even", "ever", "every",
+                       "everyone", "everything", "everywhere", "except", "few", "fifteen", "fify", "fill",
+                       "find", "fire", "first", "five", "for", "former", "formerly", "forty", "found",
+                       "four", "from", "front", "full", "further", "get", "give", "go", "had", "has",
+                       "hasnt", "have", "he", "hence", "her", "here", "hereafter", "hereby", "herein",
+                       "hereupon", "hers", "herself", "him", "himself", "his", "how", "however", "hundred",
+                       "ie", "if", "in", "inc", "indeed", "interest", "into", "is", "it", "its", "itself",
+                       "keep", "last", "latter", "latterly", "least", "less", "ltd", "made", "many", "may",
+                       "me", "meanwhile", "might", "mill", "mine", "more", "moreover", "most", "mostly",
+                       "move", "much", "must", "my", "myself", "name", "namely", "neither", "never", "nevertheless",
+                       "next", "nine", "no", "nobody", "none", "noone", "nor", "not", "nothing", "now", "nowhere",
+                       "of", "off", "often", "on", "once", "one", "only", "onto", "or", "other", "others",
+                       "otherwise", "our", "ours", "ourselves", "out", "over", "own","part", "per", "perhaps",
+                       "please", "put", "rather", "re", "same", "see", "seem", "seemed", "seeming", "seems",
+                       "serious", "several", "she", "should", "show", "side", "since", "sincere", "six", "sixty",
+                       "so", "some", "somehow", "someone", "something", "sometime", "sometimes", "somewhere",
+                       "still", "such", "system", "take", "ten", "than", "that", "the", "their", "them",
+                       "themselves", "then", "thence", "there", "thereafter", "thereby", "therefore", "therein",
+                       "thereupon", "these", "they", "thickv", "thin", "third", "this", "those", "though",
+                       "three", "through", "throughout", "thru", "thus", "to", "together", "too", "top",
+                       "toward", "towards", "twelve", "twenty", "two", "un", "under", "until", "up", "upon",
+                       "us", "very", "via", "was", "we", "well", "were", "what", "whatever", "when", "whence",
+                       "whenever", "where", "whereafter", "whereas", "whereby", "wherein", "whereupon",
+                       "wherever", "whether", "which", "while", "whither", "who", "whoever", "whole",
+                       "whom", "whose", "why", "will", "with", "within", "without", "would", "yet", "you",
+                       "your", "yours", "yourself", "yourselves", "s", "t", "d"])
+
+
+class StopwordFilter(object):
+    """ removes stopwords and stop phrases from text
+    Input: words to remove (default STOPWORDS), phrases of several words
+
+    NB single words are looked up in a frozenset.  Phrases are matched on
+       whole words with an Aho-Corasick automaton, so all words and phrases
+       are removed in one pass however many phrases there are; every word
+       covered by a match is removed, also where matches overlap.
+
+    >>> StopwordFilter().remove('a sentence with some sans common stopwords')
+    'sentence sans common stopwords'
+    >>> f = StopwordFilter(['the'], phrases=['in spain', 'spain falls'])
+    >>> f.remove('the rain in spain falls mainly in the plain')
+    'rain mainly in plain'
+    """
+    def __init__(self, words=STOPWORDS, phrases=()):
+        words = set(words)
+        # automaton: goto[state] maps a word to the next state, longest[state]
+        # is the length of the longest phrase ending at the state
+        self.goto, self.longest = [{}], [0]
+        for phrase in phrases:
+            phrase = phrase.split(" ")
+            if len(phrase) == 1:
+                words.add(phrase[0])
+                continue
+            state = 0
+            for w in phrase:
+                if w not in self.goto[state]:
+                    self.goto.append({})
+                    self.longest.append(0)
+                    self.goto[state][w] = len(self.goto) - 1
+                state = self.goto[state][w]
+            self.longest[state] = len(phrase)
+        self.words = frozenset(words)
+        self.fail = self._failure_links()
+
+    def _failure_links(self):
+        """ breadth first, fail[state] is the longest proper suffix state """
+        fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for w, child in self.goto[state].items():
+                queue.append(child)
+                f = fail[state]
+                while f and w not in self.goto[f]:
+                    f = fail[f]
+                fail[child] = self.goto[f].get(w, 0)
+                self.longest[child] = max(self.longest[child], self.longest[fail[child]])
+        return fail
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def remove(self, s):
+        """ text string s without the stopwords and phrases """
+        words = s.split(" ")
+        if len(self.goto) == 1:
+            return " ".join([w for w in words if w not in self.words])
+        keep = [w not in self.words for w in words]
+        goto, fail, longest = self.goto, self.fail, self.longest
+        state = 0
+        for i, w in enumerate(words):
+            while state and w not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(w, 0)
+            for j in range(i - longest[state] + 1, i + 1):
+                keep[j] = False
+        return " ".join([w for w, k in zip(words, keep) if k])
+
+
+_stopword_filter = StopwordFilter()
+
+
 def remove_stopwords(s):
     """ remove common words
     Input: text string s
     Output: text string with stop words removed
 
+    NB see StopwordFilter for other word lists and phrases
+
     >>> remove_stopwords('a sentence with some sans common stopwords')
     'sentence sans common stopwords'
     """
-    stopwords = ["a", "about", "above", "above", "across", "after", "afterwards", "again",
-                  "against", "all", "almost", "alone", "along", "already", "also","although",
-                  "always","am","among", "amongst", "amoungst", "amount",  "an", "and", "another",
-                  "any","anyhow","anyone","anything","anyway", "anywhere", "are", "around", "as",
-                  "at", "back","be","became", "because","become","becomes", "becoming", "been",
-                  "before", "beforehand", "behind", "being", "below", "beside", "besides",
-                  "between", "beyond", "bill", "both", "bottom","but", "by", "call", "can",
-                  "cannot", "cant", "co", "con", "could", "couldnt", "cry", "de", "describe",
-                  "detail", "do", "done", "down", "due", "during", "each", "eg", "eight", "either",
-                  "eleven","else", "elsewhere", "empty", "enough", "etc", "even", "ever", "every",
-                  "everyone", "everything", "everywhere", "except", "few", "fifteen", "fify", "fill",
-                  "find", "fire", "first", "five", "for", "former", "formerly", "forty", "found",
-                  "four", "from", "front", "full", "further", "get", "give", "go", "had", "has",
-                  "hasnt", "have", "he", "hence", "her", "here", "hereafter", "hereby", "herein",
-                  "hereupon", "hers", "herself", "him", "himself", "his", "how", "however", "hundred",
-                  "ie", "if", "in", "inc", "indeed", "interest", "into", "is", "it", "its", "itself",
-                  "keep", "last", "latter", "latterly", "least", "less", "ltd", "made", "many", "may",
-                  "me", "meanwhile", "might", "mill", "mine", "more", "moreover", "most", "mostly",
-                  "move", "much", "must", "my", "myself", "name", "namely", "neither", "never", "nevertheless",
-                  "next", "nine", "no", "nobody", "none", "noone", "nor", "not", "nothing", "now", "nowhere",
-                  "of", "off", "often", "on", "once", "one", "only", "onto", "or", "other", "others",
-                  "otherwise", "our", "ours", "ourselves", "out", "over", "own","part", "per", "perhaps",
-                  "please", "put", "rather", "re", "same", "see", "seem", "seemed", "seeming", "seems",
-                  "serious", "several", "she", "should", "show", "side", "since", "sincere", "six", "sixty",
-                  "so", "some", "somehow", "someone", "something", "sometime", "sometimes", "somewhere",
-                  "still", "such", "system", "take", "ten", "than", "that", "the", "their", "them",
-                  "themselves", "then", "thence", "there", "thereafter", "thereby", "therefore", "therein",
-                  "thereupon", "these", "they", "thickv", "thin", "third", "this", "those", "though",
-                  "three", "through", "throughout", "thru", "thus", "to", "together", "too", "top",
-                  "toward", "towards", "twelve", "twenty", "two", "un", "under", "until", "up", "upon",
-                  "us", "very", "via", "was", "we", "well", "were", "what", "whatever", "when", "whence",
-                  "whenever", "where", "whereafter", "whereas", "whereby", "wherein", "whereupon",
-                  "wherever", "whether", "which", "while", "whither", "who", "whoever", "whole",
-                  "whom", "whose", "why", "will", "with", "within", "without", "would", "yet", "you",
-                  "your", "yours", "yourself", "yourselves", "s", "t", "d"]
-    uncommon_words = list(filter(lambda x: x not in stopwords, s.split(" ")))
-    return " ".join(uncommon_words)
+    return _stopword_filter.remove(s)
+
+
+_exceptions_ing = re.compile(r"""[A-Za-z]ing|[A-Za-z].ing|
+                             [Ss]omething|[Nn]othing|[Dd]uring|[Ee]vening|[Mm]orning|
+                             [Ss]tring|[Cc]eiling|[Ss]terling|[Cc]ling|[Gg]osling|
+                             [Ii]cing|[Ss]hilling|[Ss]ting|[Vv]iking|[Ff]iling|[Cc]arling""", re.X)
+_suffixes = re.compile(r'^(.*?)(ies|es|s|ed|ing|ative|ive|ious|ously|ally|ly|ment)?$')
 
 
 def stem(word):
@@ -381,16 +517,56 @@ def stem(word):
     >>> stem('sterling')
     'sterling'
     """
-    exceptions_ing = re.compile(r"""[A-Za-z]ing|[A-Za-z].ing|
-                                 [Ss]omething|[Nn]othing|[Dd]uring|[Ee]vening|[Mm]orning|
-                                 [Ss]tring|[Cc]eiling|[Ss]terling|[Cc]ling|[Gg]osling|
-                                 [Ii]cing|[Ss]hilling|[Ss]ting|[Vv]iking|[Ff]iling|[Cc]arling""", re.X)
-    if exceptions_ing.match(word):
+    if _exceptions_ing.match(word):
         return word
     else:
-       regex = r'^(.*?)(ies|es|s|ed|ing|ative|ive|ious|ously|ally|ly|ment)?$'
-       stem, _suffix = re.findall(regex, word)[0]
-       return stem
+       return _suffixes.match(word).group(1)
+
+
+class Stemmer(object):
+    """ stem with a bounded least recently used cache
+    Input: maxsize, the number of words to remember
+
+    NB word frequencies are heavily skewed, so most words are stemmed once.
+
+    >>> stemmer = Stemmer(maxsize=1000)
+    >>> stemmer.stem_string('a test for stemming a test')
+    'a test for stemm a test'
+    >>> stemmer.stem_many(['thinking', 'derives'])
+    ['think', 'deriv']
+    >>> stemmer.hits, stemmer.misses, stemmer.hit_rate()
+    (2, 6, 0.25)
+    """
+    def __init__(self, maxsize=100000):
+        self.stem = lru_cache(maxsize=maxsize)(stem)
+
+    def stem_many(self, words):
+        """ list of stemmed words """
+        return list(map(self.stem, words))
+
+    def stem_string(self, s):
+        """ same as stem_string(s) """
+        return " ".join(map(self.stem, s.split(" ")))
+
+    @property
+    def hits(self):
+        return self.stem.cache_info().hits
+
+    @property
+    def misses(self):
+        return self.stem.cache_info().misses
+
+    def hit_rate(self):
+        """ fraction of words found in the cache """
+        info = self.stem.cache_info()
+        total = info.hits + info.misses
+        return info.hits / float(total) if total else 0.0
+
+    def cache_clear(self):
+        self.stem.cache_clear()
+
+
+_stemmer = Stemmer()
 
 
 def stem_string(s):
@@ -401,33 +577,171 @@ def stem_string(s):
     >>> stem_string('a test for stemming')
     'a test for stemm'
     """
-    words = s.split(" ")
-    stemmed_words = [stem(w) for w in words]
-    return " ".join(stemmed_words)
+    return _stemmer.stem_string(s)
+
+
+class Normalizer(object):
+    """ precompiled version of the text processing chain used by tokenize
+    ie expand, standardize_abbreviations, remove_numbers, lowercase,
+    uppercase_i and remove_punctuation applied in that order
 
+    NB output is identical to the chain, but a handful of scans replace
+       the ~40 regex passes: contractions are only looked up in words that
+       hold an apostrophe, the abbreviation, case and i rules are combined
+       alternations, and the number rules only run around digits.
 
-def tokenize(s, n=1, removing_stopwords=False, stemming=False):
+    >>> Normalizer().normalize("It's 5 o'clock and the U.S. Jak-1 test isn't done.")
+    'it is of the clock and the US JAK1 test is not done '
+    >>> Normalizer().normalize("I think i can")
+    'I think I can'
+    """
+    def __init__(self):
+        # each contraction becomes an alternative anchored on its apostrophe,
+        # in order, so the first alternative to match is the one expand applies
+        self.contractions, sites = [], []
+        for pattern, replacement in _contractions:
+            left, right = pattern.pattern.split("'")
+            width = len(re.sub(r'\[[^]]*\]', '.', left))
+            self.contractions.append((width, replacement))
+            sites.append("((?<=%s)'%s)" % (left, right) if left else "('%s)" % right)
+        self.sites = re.compile("|".join(sites))
+        self.letters = re.compile(r'[A-Za-z]*')
+        # lookbehinds after the literal, so the scan can skip to . and -
+        self.abbreviations = re.compile(r'\.(?<=[A-Z]\.)-?|-(?<=[A-Za-z]-)')
+        self.digits = re.compile(r'\d+')
+        self.acronym_numbers = re.compile(r'[A-Z]*[a-z]*[0-9]+')
+        self.case = re.compile(r'[A-Z][a-z]+|\s+i\s+')
+        self.punctuation = re.compile(r'[^A-Za-z0-9]+')
+
+    def expand(self, s):
+        """ same as expand(s)
+
+        NB contractions are letters around a single apostrophe, so unless two
+           apostrophes are joined by letters alone (eg rock'n'roll, which
+           gets the full rule list) each one needs a single lookup.
+
+        >>> Normalizer().expand("It's cold, isn't it? I shan't")
+        'it is cold, is not it? I sha not'
+        """
+        q = s.find("'")
+        if q < 0:
+            return s
+        pieces, done = [], 0
+        while q >= 0:
+            first = q
+            following = s.find("'", q + 1)
+            while following > q + 1 and s[q+1:following].isascii() and s[q+1:following].isalpha():
+                q, following = following, s.find("'", following + 1)
+            if first == q:
+                m = self.sites.match(s, q)
+                if m:
+                    width, replacement = self.contractions[m.lastindex - 1]
+                    pieces.append(s[done:q - width])
+                    pieces.append(replacement)
+                    done = m.end()
+            else:
+                lo, hi = first, self.letters.match(s, q + 1).end()
+                while lo > done and s[lo-1].isascii() and s[lo-1].isalpha():
+                    lo -= 1
+                pieces.append(s[done:lo])
+                pieces.append(expand(s[lo:hi]))
+                done = hi
+            q = following
+        pieces.append(s[done:])
+        return "".join(pieces)
+
+    @staticmethod
+    def _case(m):
+        word = m.group()
+        return word.lower() if word[0].isupper() else word.upper()
+
+    def numbers(self, s):
+        """ same as the digit rules of standardize_abbreviations followed by
+        remove_numbers
+
+        NB every match of these rules holds a digit and reaches back over
+           letters, signs and one more character at most, so only the text
+           around each run of digits is scanned.
+
+        >>> Normalizer().numbers("the mean of 55 samples on jak1 is -1.5 now")
+        'the mean of samples on JAK1 is now'
+        """
+        regions = []
+        for m in self.digits.finditer(s):
+            lo = m.start()
+            while lo > 0 and (s[lo-1] in '+-' or s[lo-1].isascii() and s[lo-1].isalpha()):
+                lo -= 1
+            lo, hi = max(lo - 1, 0), m.end() + 1
+            if regions and lo <= regions[-1][1]:
+                regions[-1][1] = hi
+            else:
+                regions.append([lo, hi])
+        if not regions:
+            return s
+        pieces, done = [], 0
+        for lo, hi in regions:
+            region = self.acronym_numbers.sub(lambda x: x.group().upper(), s[lo:hi])
+            pieces.append(s[done:lo])
+            pieces.append(remove_numbers(region))
+            done = hi
+        pieces.append(s[done:])
+        return "".join(pieces)
+
+    def normalize(self, s):
+        """ same as the tokenize processing chain (before stopwords and stemming) """
+        s = self.expand(s)
+        s = self.abbreviations.sub('', s)
+        s = self.numbers(s)
+        # lowercase and uppercase_i, the ^ rules only concern the first character
+        s = self.case.sub(self._case, s)
+        if len(s) > 1 and s[1].isspace():
+            if 'A' <= s[0] <= 'Z' or s[0] == 'i':
+                s = ('I' if s[0] in 'Ii' else s[0].lower()) + s[1:]
+        return self.punctuation.sub(' ', s)
+
+
+_normalizer = Normalizer()
+
+
+def preprocess(s, removing_stopwords=False, stemming=False):
+    """ the text processing used by tokenize
+    Input: string of text s
+    Output: processed string, words separated by single spaces
+
+    >>> preprocess("The rain in Spain falls mainly in Spain.", True)
+    'rain spain falls mainly spain '
+    """
+    # NB the order of the processing functions (see Normalizer) is important!
+    s = _normalizer.normalize(s)
+    if removing_stopwords:
+        s = remove_stopwords(s)
+    if stemming:
+        s = stem_string(s)
+    return s
+
+
+def tokenize(s, n=1, removing_stopwords=False, stemming=False, k=0):
     """ lex the text
-    Input: string of text s, n-gram model with default unigram model
+    Input: string of text s, n-gram model with default unigram model,
+           skip k for skip-grams
     Output: dictionary of ngram token keys and counts (values)
 
     NB testing is moved to tests_nlp.py since more complicated tests
        are required.
     NB careful with stopword removal, sometimes they are helpful
+    NB n and k may also be tuples, to count the grams of every n and k
+       together in one pass (see iter_grams); the same words picked with
+       different skips make the same key, but unigrams, which no skip
+       changes, are counted once.
     """
-    # NB the order of the following processing functions is important!
-    s = expand(s)
-    s = standardize_abbreviations(s)
-    s = remove_numbers(s)
-    s = lowercase(s)
-    s = uppercase_i(s)
-    s = remove_punctuation(s)
-    if removing_stopwords:
-        s = remove_stopwords(s)
-    if stemming:
-        s = stem_string(s)
+    s = preprocess(s, removing_stopwords, stemming)
     tokens = {}
-    ngrams =  n_gram(n,s)
+    if isinstance(n, tuple) or isinstance(k, tuple):
+        ns = n if isinstance(n, tuple) else (n,)
+        ks = k if isinstance(k, tuple) else (k,)
+        ngrams = (gram for _, _, gram in iter_grams(s, ns, ks, join=True))
+    else:
+        ngrams = iter_skip_grams(k, n, s, join=True)
     for w in ngrams:
         if w in tokens:
             tokens[w] += 1
@@ -441,19 +755,294 @@ def merge_tokens(a,b):
     Output: combined dictionary of a and b tokens where values of same keys have been combined
 
     NB the lengths of each dictionary may differ
+
+    >>> merge_tokens({'the rain': 1, 'rain in': 1}, {'rain in': 2, 'in spain': 1})
+    {'the rain': 1, 'rain in': 3, 'in spain': 1}
     """
-    new_tokens = {}
-    for k,v in a.items():
-        if k in b:
-            new_tokens[k] = b[k] + v
-        else:
-            new_tokens[k] = v
-    for k,v in b.items():
-        if k in a:
-            new_tokens[k] = a[k] + v
+    return accumulate_tokens(dict(a), b)
+
+
+def accumulate_tokens(total, tokens):
+    """ add token counts in place
+    Input: dictionary total, updated in place, tokens to add
+    Output: total
+
+    >>> total = {'the rain': 1}
+    >>> accumulate_tokens(total, {'the rain': 1, 'rain in': 1})
+    {'the rain': 2, 'rain in': 1}
+    """
+    get = total.get
+    for k, v in tokens.items():
+        total[k] = get(k, 0) + v
+    return total
+
+
+def merge_many(token_dicts):
+    """ combine any number of token sets
+    Input: iterable of token dictionaries, eg one per document or shard
+    Output: dictionary equal to folding merge_tokens over them
+
+    NB every count is added once into a single accumulator, rather than
+       copying a growing result for every merge.
+
+    >>> merge_many([{'a': 1}, {'a': 2, 'b': 1}, {'c': 1}])
+    {'a': 3, 'b': 1, 'c': 1}
+    """
+    total = {}
+    for tokens in token_dicts:
+        if total:
+            accumulate_tokens(total, tokens)
         else:
-            new_tokens[k] = v
-    return new_tokens
+            total.update(tokens)
+    return total
+
+
+# Compact token storage
+
+class Vocabulary(object):
+    """ interns words as integer ids
+    Input: optional iterable of words, ids are given in order of first appearance
+
+    NB Vocabulary.build gives ids by frequency instead, see below
+
+    >>> vocab = Vocabulary("the rain in the plain".split())
+    >>> vocab.encode(['the', 'plain'])
+    [0, 3]
+    >>> vocab.decode([1, 2])
+    ['rain', 'in']
+    >>> len(vocab), 'rain' in vocab, vocab.get('snow')
+    (4, True, None)
+    """
+    def __init__(self, words=()):
+        self.ids = {}    # word -> id
+        self.words = []  # id -> word
+        self.counts = None  # id -> frequency in the sentences of build, 0 for words added since
+        for w in words:
+            self.add(w)
+
+    @classmethod
+    def build(cls, sentences, min_count=1, max_size=None):
+        """ vocabulary of the words of sentences, most frequent first
+        Input: iterable of sentences (lists of words), pruning by min_count
+               and max_size
+        Output: Vocabulary with ids in order of decreasing count (ties in
+                order of first appearance) and counts
+
+        >>> vocab = Vocabulary.build([['the', 'rain'], ['in', 'the', 'plain', 'rain'], ['the']], min_count=2)
+        >>> vocab.words, vocab.counts
+        (['the', 'rain'], [3, 2])
+        """
+        counts = {}
+        for sentence in sentences:
+            for w in sentence:
+                counts[w] = counts.get(w, 0) + 1
+        ranked = sorted((x for x in counts.items() if x[1] >= min_count), key=lambda x: -x[1])
+        vocab = cls(w for w, c in ranked[:max_size])
+        vocab.counts = [c for w, c in ranked[:max_size]]
+        return vocab
+
+    def encode_sentences(self, sentences, unknown=None):
+        """ sentences as one flat array of ids
+        Input: iterable of sentences (lists of words), id for unknown
+               words (default None drops them)
+        Output: int32 array of ids, int64 array of len(sentences)+1 offsets;
+                sentence i is ids[offsets[i]:offsets[i+1]]
+
+        NB unlike encode, words are never added
+
+        >>> ids, offsets = Vocabulary(['the', 'rain']).encode_sentences([['the', 'rain'], ['in', 'the', 'rain']])
+        >>> ids.tolist(), offsets.tolist()
+        ([0, 1, 0, 1], [0, 2, 4])
+        """
+        get, flat, offsets = self.ids.get, [], [0]
+        for sentence in sentences:
+            if unknown is None:
+                flat.extend(i for i in map(get, sentence) if i is not None)
+            else:
+                flat.extend(get(w, unknown) for w in sentence)
+            offsets.append(len(flat))
+        return np.array(flat, dtype=np.int32), np.array(offsets, dtype=np.int64)
+
+    def decode_sentences(self, ids, offsets):
+        """ list of sentences (lists of words) from encode_sentences """
+        return [self.decode(ids[a:b].tolist()) for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    def add(self, word):
+        """ id of word, adding it if new """
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+            if self.counts is not None:
+                self.counts.append(0)
+        return i
+
+    def get(self, word, default=None):
+        return self.ids.get(word, default)
+
+    def __getitem__(self, word):
+        return self.ids[word]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def encode(self, words):
+        """ ids of words, adding new words """
+        return [self.add(w) for w in words]
+
+    def decode(self, ids):
+        return [self.words[i] for i in ids]
+
+
+class NGramCounts(object):
+    """ n-gram counts stored as two NumPy arrays
+    Input: n, optional Vocabulary (shared vocabularies allow merging)
+
+    NB the word ids of each n-gram are packed into one int64 key, 63//n bits
+       per word, so a vocabulary may hold up to 2**(63//n) words (2**21 for
+       trigrams).  Keys are kept sorted with their counts in a parallel
+       array, 16 bytes per n-gram instead of a string and a dictionary entry.
+    NB new keys are buffered and merged into the sorted arrays once the
+       buffer is as large as they are (or when the counts are read), so
+       adding documents one at a time stays O(N log N) overall.
+    NB items() and len() behave as for a token dictionary, so the token
+       feature functions accept an NGramCounts as is; to_tokens() and
+       from_tokens() convert to and from the dictionary format.
+
+    >>> counts = NGramCounts.from_text("the rain in Spain falls mainly in Spain", 2)
+    >>> len(counts), counts['in spain'], counts['in france']
+    (6, 2, 0)
+    >>> counts.to_tokens() == tokenize("the rain in Spain falls mainly in Spain", 2)
+    True
+    >>> mean_token_occurance(counts)
+    1.1666666666666667
+    """
+    def __init__(self, n, vocabulary=None):
+        self.n = n
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.bits = 63 // n
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._pending = []  # (keys, counts) not yet merged
+        self._pending_size = 0
+
+    def _pack(self, ids):
+        """ int64 keys of the n-grams in a sequence of word ids """
+        if len(self.vocabulary) > 1 << self.bits:
+            raise ValueError("vocabulary too large for %d-grams" % self.n)
+        ids = np.asarray(ids, dtype=np.int64)
+        m = len(ids) - (self.n - 1)
+        if m <= 0:
+            return np.zeros(0, dtype=np.int64)
+        keys = np.zeros(m, dtype=np.int64)
+        for j in range(self.n):
+            keys |= ids[j:j+m] << (self.bits * (self.n - 1 - j))
+        return keys
+
+    def _unpack(self, keys):
+        """ (len(keys), n) array of word ids """
+        mask = (1 << self.bits) - 1
+        shifts = self.bits * np.arange(self.n - 1, -1, -1, dtype=np.int64)
+        return (keys[:, None] >> shifts) & mask
+
+    def _add(self, keys, counts):
+        self._pending.append((keys, counts))
+        self._pending_size += len(keys)
+        if self._pending_size >= max(65536, len(self._keys)):
+            self._merge_pending()
+        return self
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self._keys] + [k for k, c in self._pending])
+        counts = np.concatenate([self._counts] + [c for k, c in self._pending])
+        self._pending, self._pending_size = [], 0
+        if len(keys):
+            order = np.argsort(keys, kind='stable')
+            keys, counts = keys[order], counts[order]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            keys, counts = keys[starts], np.add.reduceat(counts, starts)
+        self._keys, self._counts = keys, counts
+
+    @property
+    def keys(self):
+        """ sorted int64 array of packed n-grams """
+        self._merge_pending()
+        return self._keys
+
+    @property
+    def counts(self):
+        """ int64 array of the counts of keys """
+        self._merge_pending()
+        return self._counts
+
+    def add_text(self, s, removing_stopwords=False, stemming=False):
+        """ count the n-grams of s, as tokenize(s, n) would """
+        words = preprocess(s, removing_stopwords, stemming).split(" ")
+        keys = self._pack(self.vocabulary.encode(words))
+        return self._add(keys, np.ones(len(keys), dtype=np.int64))
+
+    def add_tokens(self, tokens):
+        """ add the counts of a token dictionary of n-grams """
+        keys, counts = [], []
+        for k, c in tokens.items():
+            ids = self.vocabulary.encode(k.split(" "))
+            if len(ids) != self.n:
+                raise ValueError("expected %d-grams, got %r" % (self.n, k))
+            keys.append(self._pack(ids)[0])
+            counts.append(c)
+        return self._add(np.array(keys, dtype=np.int64), np.array(counts, dtype=np.int64))
+
+    @classmethod
+    def from_text(cls, s, n=1, removing_stopwords=False, stemming=False, vocabulary=None):
+        return cls(n, vocabulary).add_text(s, removing_stopwords, stemming)
+
+    @classmethod
+    def from_tokens(cls, tokens, n=None, vocabulary=None):
+        """ NB n defaults to the length of the first token """
+        if n is None:
+            n = len(next(iter(tokens)).split(" ")) if tokens else 1
+        return cls(n, vocabulary).add_tokens(tokens)
+
+    def merge(self, other):
+        """ new NGramCounts with the counts of both, which must share a vocabulary """
+        if other.vocabulary is not self.vocabulary or other.n != self.n:
+            raise ValueError("can only merge counts of the same n and vocabulary")
+        merged = NGramCounts(self.n, self.vocabulary)
+        merged._keys, merged._counts = self.keys, self.counts
+        merged._add(other.keys, other.counts)
+        merged._merge_pending()
+        return merged
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, ngram):
+        ids = [self.vocabulary.get(w) for w in ngram.split(" ")]
+        if len(ids) != self.n or None in ids:
+            return 0
+        key = self._pack(ids)[0]
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return int(self.counts[i])
+        return 0
+
+    def __contains__(self, ngram):
+        return self[ngram] > 0
+
+    def items(self):
+        """ (n-gram string, count) pairs, in key order """
+        words = self.vocabulary.words
+        for ids, c in zip(self._unpack(self.keys).tolist(), self.counts.tolist()):
+            yield " ".join([words[i] for i in ids]), c
+
+    def to_tokens(self):
+        """ token dictionary, as returned by tokenize """
+        return dict(self.items())
 
 
 # Simple string features
@@ -526,6 +1115,9 @@ def mean_corpus_word_length(tokens):
     return reduce(lambda acc, x: acc + len(x[0])*x[1], tokens.items(), 0) / total
 
 
+_personal_pronouns = frozenset(['I','me','you','he','him','his','she','her','it','we','they','them','us'])
+
+
 def personal_pronoun_density(tokens):
     """ get ration of personal pronouns to words
     Input: tokens
@@ -535,10 +1127,8 @@ def personal_pronoun_density(tokens):
     >>> personal_pronoun_density({'a': 2, 'simple': 1, 'version': 1, 'tokenizer': 1, 'of': 2, 'he': 2, 'she': 5})
     0.5
     """
-    pp = ['I','me','you','he','him','his','she','her','it','we','they','them','us']
     total = float(sum(map(lambda x: x[1], tokens.items())))
-    pros = list(filter(lambda x: x[0] in pp, tokens.items()))
-    counts = reduce(lambda acc, x: acc + x[1], pros, 0)
+    counts = sum(c for w, c in tokens.items() if w in _personal_pronouns)
     return counts/total
 
 
@@ -553,22 +1143,75 @@ def anagram(a,b):
     return sorted(a) == sorted(b)
 
 
+class AnagramIndex(object):
+    """ words grouped by signature (their sorted letters)
+    Input: optional iterable of words
+
+    NB one pass over the words, adding a word or looking up its anagrams
+       costs a sort of its letters and a dictionary lookup.
+
+    >>> index = AnagramIndex(['listen', 'test', 'silent'])
+    >>> index.add('enlist')
+    >>> index.anagrams_of('tinsel')
+    ['listen', 'silent', 'enlist']
+    >>> index.pairs()
+    [('listen', 'silent'), ('listen', 'enlist'), ('silent', 'enlist')]
+    """
+    def __init__(self, words=()):
+        self.words = []      # insertion order
+        self.positions = {}  # word -> (signature, position in group)
+        self.groups = {}     # signature -> words
+        for w in words:
+            self.add(w)
+
+    @staticmethod
+    def signature(word):
+        return "".join(sorted(word))
+
+    def add(self, word):
+        """ insert a word, repeats are ignored """
+        if word not in self.positions:
+            signature = self.signature(word)
+            group = self.groups.setdefault(signature, [])
+            self.positions[word] = (signature, len(group))
+            group.append(word)
+            self.words.append(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.positions
+
+    def anagrams_of(self, word):
+        """ all other indexed words with the same letters as word """
+        return [w for w in self.groups.get(self.signature(word), []) if w != word]
+
+    def anagram_groups(self):
+        """ lists of two or more words that are anagrams of each other """
+        return [group for group in self.groups.values() if len(group) > 1]
+
+    def pairs(self):
+        """ anagram tuples, ordered as anagrams(words) orders them """
+        agrams = []
+        for x in self.words:
+            signature, i = self.positions[x]
+            group = self.groups[signature]
+            agrams.extend((x, y) for y in group[i+1:])
+        return agrams
+
+
 def anagrams(words):
     """
     Input: list of words
     Output: list of anagram tuples
 
+    NB repeated words are only paired once
+
     >>> anagrams(['test','listen','silent','ceiiinosssttuv','zest','uttensiosicvis','hamlet','amleth'])
     [('listen', 'silent'), ('ceiiinosssttuv', 'uttensiosicvis'), ('hamlet', 'amleth')]
     """
-    agrams = []
-    for x in words:
-        for y in words:
-            if x != y:
-                if anagram(x,y):
-                    if (y,x) not in agrams:
-                        agrams.append((x,y))
-    return agrams
+    return AnagramIndex(words).pairs()
 
 
 def anagram_vocab_density(tokens):
@@ -580,9 +1223,9 @@ def anagram_vocab_density(tokens):
     0.25
     """
     total = float(len(tokens))
-    words = tokens.keys()
-    agrams = anagrams(words)
-    return (len(agrams)*2.0)/total
+    # each of the k(k-1)/2 pairs in a group counts twice
+    groups = AnagramIndex(tokens).anagram_groups()
+    return sum(len(g)*(len(g)-1) for g in groups) / total
 
 
 def anagram_corpus_density(tokens):
@@ -591,9 +1234,78 @@ def anagram_corpus_density(tokens):
     0.3
     """
     total = float(sum(map(lambda x: x[1], tokens.items())))
-    words = tokens.keys()
-    agrams = anagrams(words)
-    return sum(map(lambda x: tokens[x[0]] + tokens[x[1]], agrams)) / total
+    # each word of a group of k is paired with the k-1 others
+    groups = AnagramIndex(tokens).anagram_groups()
+    return sum((len(g)-1)*sum(tokens[w] for w in g) for g in groups) / total
+
+
+# Feature extraction
+
+FEATURES = ('mean_sentence_length', 'mean_words_in_sentence', 'mean_token_occurance',
+            'mean_vocab_word_length', 'mean_corpus_word_length', 'personal_pronoun_density',
+            'anagram_vocab_density', 'anagram_corpus_density')
+
+
+def text_features(s, removing_stopwords=False, stemming=False):
+    """ all the string and token features of a text
+    Input: string text s, tokenize options
+    Output: list of the FEATURES, the token features are of tokenize(s)
+
+    NB the sentences are extracted once and the tokens are visited once;
+       features that are undefined (no sentences, no tokens) are nan.
+
+    >>> text_features("I'm a very long sentence. Me too! And me?")
+    [13.0, 3.0, 1.1, 2.8, 2.727272727272727, 0.2727272727272727, 0.0, 0.0]
+    """
+    sentences = simple_extract_sentences(s)
+    characters = words = 0
+    for sentence in sentences:
+        characters += len(sentence)
+        words += len(sentence.split(" "))
+    tokens = tokenize(s, 1, removing_stopwords, stemming)
+    total = vocab_length = corpus_length = pronouns = 0
+    groups = {}  # signature -> [words, occurrences]
+    for w, c in tokens.items():
+        total += c
+        vocab_length += len(w)
+        corpus_length += len(w)*c
+        if w in _personal_pronouns:
+            pronouns += c
+        group = groups.setdefault(AnagramIndex.signature(w), [0, 0])
+        group[0] += 1
+        group[1] += c
+    vocab_anagrams = sum(k*(k-1) for k, c in groups.values())
+    corpus_anagrams = sum((k-1)*c for k, c in groups.values())
+
+    def ratio(a, b):
+        return a / float(b) if b else float('nan')
+    vocab = len(tokens)
+    return [ratio(characters, len(sentences)), ratio(words, len(sentences)),
+            ratio(total, vocab), ratio(vocab_length, vocab), ratio(corpus_length, total),
+            ratio(pronouns, total), ratio(vocab_anagrams, vocab), ratio(corpus_anagrams, total)]
+
+
+def _text_features(args):
+    return text_features(*args)
+
+
+def extract_features(docs, removing_stopwords=False, stemming=False, processes=1, chunksize=100):
+    """ feature matrix of a batch of documents
+    Input: list of documents, tokenize options, number of worker processes
+           (None for all cores), documents sent to a worker at a time
+    Output: (len(docs), len(FEATURES)) array, row i is text_features(docs[i])
+
+    >>> extract_features(["I'm a very long sentence. Me too! And me?", "The rain in Spain."]).shape
+    (2, 8)
+    """
+    args = [(doc, removing_stopwords, stemming) for doc in docs]
+    if processes == 1:
+        rows = list(map(_text_features, args))
+    else:
+        import multiprocessing
+        with multiprocessing.Pool(processes) as pool:
+            rows = pool.map(_text_features, args, chunksize)
+    return np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURES))
 
 
 # Classification tools
@@ -616,6 +1328,93 @@ def tfidf(term, doc, docs):
     return tf*idf
 
 
+class TfidfVectorizer(object):
+    """ tfidf for a whole corpus, the same values as tfidf(term, doc, docs)
+    where docs are all the documents fitted so far
+
+    NB the vocabulary, document frequencies and an inverted index (term ->
+       indices of fitted documents holding it) are built once, in one pass,
+       and can be extended with partial_fit as documents arrive.
+    NB documents are lists of terms, eg n_gram(1, s) or keys of tokenize.
+
+    >>> docs = [['a'],['a','c','c'],['a','b','c']]
+    >>> vectorizer = TfidfVectorizer().fit(docs)
+    >>> X = vectorizer.transform([['a','c','c']])
+    >>> float(X[0, vectorizer.vocabulary['c']]) == tfidf('c', ['a','c','c'], docs)
+    True
+    >>> vectorizer.documents_with('c')
+    [1, 2]
+    """
+    def __init__(self):
+        self.vocabulary = {}          # term -> column
+        self.terms = []               # column -> term
+        self.document_frequency = []  # column -> number of documents holding the term
+        self.postings = []            # column -> indices of the documents holding the term
+        self.n_documents = 0
+        self._idf = None
+
+    def partial_fit(self, docs):
+        """ add documents to the fitted corpus """
+        for doc in docs:
+            for term in set(doc):
+                column = self.vocabulary.get(term)
+                if column is None:
+                    column = self.vocabulary[term] = len(self.terms)
+                    self.terms.append(term)
+                    self.document_frequency.append(0)
+                    self.postings.append([])
+                self.document_frequency[column] += 1
+                self.postings[column].append(self.n_documents)
+            self.n_documents += 1
+        self._idf = None
+        return self
+
+    def fit(self, docs):
+        """ fit the corpus from scratch """
+        self.__init__()
+        return self.partial_fit(docs)
+
+    def idf(self):
+        """ smoothed inverse document frequency of each column, cached """
+        if self._idf is None:
+            n = float(self.n_documents)
+            self._idf = [math.log(1.0 + (n/df)) for df in self.document_frequency]
+        return self._idf
+
+    def documents_with(self, term):
+        """ indices of the fitted documents holding term """
+        column = self.vocabulary.get(term)
+        return [] if column is None else self.postings[column]
+
+    def transform(self, docs):
+        """ tfidf of every fitted term for each document
+        Output: scipy.sparse csr matrix with a row per document
+
+        NB terms that were never fitted are left out, but still count in
+           the length of the document.
+        """
+        from scipy import sparse
+        idf = self.idf()
+        data, indices, indptr = [], [], [0]
+        for doc in docs:
+            counts = {}
+            for term in doc:
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    counts[column] = counts.get(column, 0) + 1
+            for column, count in sorted(counts.items()):
+                tf = float(count)/len(doc)
+                data.append(tf*idf[column])
+                indices.append(column)
+            indptr.append(len(indices))
+        return sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64),
+                                  np.array(indptr, dtype=np.int64)), shape=(len(indptr) - 1, len(self.terms)))
+
+    def fit_transform(self, docs):
+        docs = list(docs)
+        return self.fit(docs).transform(docs)
+
+
 # Models
 
 def n_gram(n, s):
@@ -660,6 +1459,107 @@ def skip_gram(k, n, s):
     return [" ".join(i) for i in sgrams]
 
 
+def iter_words(s, chunk_size=65536):
+    """ the words of s.split(" ") one at a time, without the full list
+
+    NB s is split a slice of about chunk_size characters at a time
+
+    >>> list(iter_words("the rain  in", 4))
+    ['the', 'rain', '', 'in']
+    """
+    start = 0
+    end = s.find(" ", chunk_size)
+    while end >= 0:
+        yield from s[start:end].split(" ")
+        start = end + 1
+        end = s.find(" ", start + chunk_size)
+    yield from s[start:].split(" ")
+
+
+def _words(words, vocabulary):
+    if isinstance(words, str):
+        words = iter_words(words)
+    if vocabulary is not None:
+        words = map(vocabulary.add, words)
+    return words
+
+
+def _skip_grams(k, n, words, make):
+    """ grams of a single n and k from a ring buffer of (1+k)*(n-1)+1 words """
+    span = (1 + k)*(n - 1) + 1
+    buffer = deque(maxlen=span)
+    for w in words:
+        buffer.append(w)
+        if len(buffer) == span:
+            yield make(buffer if k == 0 else islice(buffer, 0, None, k + 1))
+
+
+def iter_ngrams(n, words, vocabulary=None, join=False):
+    """ lazy n_gram
+    Input: n, string s (split on spaces) or iterable of words, optional
+           Vocabulary to give word ids, join to give strings as n_gram does
+    Output: generator of n-gram tuples (or strings), in the order of n_gram
+
+    NB only the last n words are held, in a ring buffer.
+
+    >>> list(iter_ngrams(2, "the rain in Spain"))
+    [('the', 'rain'), ('rain', 'in'), ('in', 'Spain')]
+    >>> list(iter_ngrams(2, "the rain in Spain", join=True)) == n_gram(2, "the rain in Spain")
+    True
+    """
+    words = _words(words, vocabulary)
+    if n == 1 and join:
+        return iter(words)
+    return _skip_grams(0, n, words, " ".join if join else tuple)
+
+
+def iter_skip_grams(k, n, words, vocabulary=None, join=False):
+    """ lazy skip_gram, as iter_ngrams
+
+    NB only the last (1+k)*(n-1)+1 words are held.
+
+    >>> list(iter_skip_grams(1, 2, "the rain in Spain falls", join=True))
+    ['the in', 'rain Spain', 'in falls']
+    >>> list(iter_skip_grams(2, 2, "the rain in Spain falls", Vocabulary()))
+    [(0, 3), (1, 4)]
+    """
+    if k == 0:
+        return iter_ngrams(n, words, vocabulary, join)
+    return _skip_grams(k, n, _words(words, vocabulary), " ".join if join else tuple)
+
+
+def iter_grams(words, ns=(1,), ks=(0,), vocabulary=None, join=False):
+    """ n-grams and skip-grams of several orders in one pass
+    Input: as iter_ngrams, with orders ns and skips ks
+    Output: generator of (n, k, gram) for every n in ns and k in ks
+
+    NB a gram is yielded as soon as its last word is read, so grams come in
+       order of their last word.
+    NB skips that pick the same words are yielded once, under the first
+       k: unigrams only for ks[0].
+
+    >>> list(iter_grams("the rain in Spain", (1, 2), join=True))
+    [(1, 0, 'the'), (1, 0, 'rain'), (2, 0, 'the rain'), (1, 0, 'in'), (2, 0, 'rain in'), (1, 0, 'Spain'), (2, 0, 'in Spain')]
+    >>> list(iter_grams("the rain in", (1, 2), (0, 1), join=True))
+    [(1, 0, 'the'), (1, 0, 'rain'), (2, 0, 'the rain'), (1, 0, 'in'), (2, 0, 'rain in'), (2, 1, 'the in')]
+    """
+    spans, seen = [], set()
+    for n in ns:
+        for k in ks:
+            span = (1 + k)*(n - 1) + 1
+            if (n, span) not in seen:
+                seen.add((n, span))
+                spans.append((n, k, span))
+    buffer = deque(maxlen=max(span for n, k, span in spans))
+    make = " ".join if join else tuple
+    for w in _words(words, vocabulary):
+        buffer.append(w)
+        seen = len(buffer)
+        for n, k, span in spans:
+            if span <= seen:
+                yield n, k, make(islice(buffer, seen - span, None, k + 1))
+
+
 def bigram_predict(t, s):
     """ predict next word based on tokens
     Input: tokens t, string s
@@ -684,18 +1584,82 @@ def bigram_predict(t, s):
     return next_word
 
 
+class NGramModel(object):
+    """ next word prediction from n-gram tokens
+    Input: tokens of a single order n >= 2, eg tokenize(s, n)
+
+    NB words are stored as integer ids, and for every context (the last 1
+       to n-1 words) the possible next words are sorted once by count, so a
+       top-k prediction is a dictionary lookup plus k items.
+    NB the counts for shorter contexts come from the ends of the n-grams,
+       and prediction backs off from the longest known context to shorter ones.
+    NB with bigrams, next_word gives the same answer as bigram_predict.
+
+    >>> model = NGramModel({'the rain': 2, 'in spain': 2, 'rain in': 2, 'spain falls': 1, 'falls mainly': 1, 'mainly in': 1})
+    >>> model.next_word('in the')
+    'rain'
+    >>> model.next_word('in bed')
+    ''
+    >>> model = NGramModel(tokenize("the rain in Spain falls mainly in Spain and the rain in Wales falls too", 3))
+    >>> model.predict('rain in', 2)
+    ['spain', 'wales']
+    >>> model.predict('snow falls')
+    ['mainly']
+    """
+    def __init__(self, tokens):
+        self.vocabulary = {}  # word -> id
+        self.words = []       # id -> word
+        self.order = 0
+        counts = {}
+        for key, count in tokens.items():
+            ids = tuple(self._id(w) for w in key.split(" "))
+            self.order = max(self.order, len(ids))
+            for j in range(len(ids) - 1):
+                following = counts.setdefault(ids[j:-1], {})
+                following[ids[-1]] = following.get(ids[-1], 0) + count
+        # context -> next word ids, most frequent first (ties in order seen)
+        self.index = {}
+        for context, following in counts.items():
+            self.index[context] = [i for i, c in sorted(following.items(), key=lambda x: -x[1])]
+
+    def _id(self, word):
+        if word not in self.vocabulary:
+            self.vocabulary[word] = len(self.words)
+            self.words.append(word)
+        return self.vocabulary[word]
+
+    def predict(self, s, k=1):
+        """ up to k most likely next words after string s, using the
+        longest context of s seen in the tokens
+        """
+        words = s.split(" ")
+        for length in range(min(self.order - 1, len(words)), 0, -1):
+            context = words[len(words)-length:]
+            if all(w in self.vocabulary for w in context):
+                following = self.index.get(tuple(self.vocabulary[w] for w in context))
+                if following:
+                    return [self.words[i] for i in following[:k]]
+        return []
+
+    def next_word(self, s):
+        """ most likely next word after string s, empty string on no match """
+        prediction = self.predict(s, 1)
+        return prediction[0] if prediction else ''
+
+
 
 def tokens(sentences):
     """ expecting a list of sentences where
     each sentence is a list of words
     there are no counts associated with these tokens, just the vocabulary
+
+    NB see Vocabulary.build for a vocabulary with counts and pruning
+
+    >>> tokens([['I', 'like', 'NLP'], ['I', 'like', 'problems']])
+    ['I', 'like', 'NLP', 'problems']
     """
-    t = []
-    for sentence in sentences:
-        for w in sentence:
-            if w not in t:
-                t.append(w)
-    return t
+    # dictionary keys keep their first insertion order
+    return list(dict.fromkeys(w for sentence in sentences for w in sentence))
 
 
 def get_cooccurance_count(window, target, neighbor, sentences):
@@ -704,25 +1668,117 @@ def get_cooccurance_count(window, target, neighbor, sentences):
     window is number of words to examine on each side of target occurance
     >>> get_cooccurance_count(1, 'NLP', 'like', [['I','like','NLP'],['I','like','NLP','problems']])
     2
+    >>> get_cooccurance_count(2, 'I', 'like', [['I','like','NLP'],['I','like','NLP','problems']])
+    2
     """
     count = 0
     for s in sentences:
-        count += sum((s[i-window:i]+s[i+1:i+1+window]).count(neighbor) for i,w in enumerate(s) if w == target)
+        count += sum((s[max(0, i-window):i]+s[i+1:i+1+window]).count(neighbor) for i,w in enumerate(s) if w == target)
     return count
 
 
+def _cooccurance_blocks(ids, sentences, block):
+    """ yield flat arrays of word ids (-1 when not in ids) and the
+    sentence each position belongs to, about block words at a time
+    """
+    words, lengths = [], []
+    for sentence in sentences:
+        words.extend(ids.get(w, -1) for w in sentence)
+        lengths.append(len(sentence))
+        if len(words) >= block:
+            yield np.array(words, dtype=np.int64), np.repeat(np.arange(len(lengths)), lengths)
+            words, lengths = [], []
+    if words:
+        yield np.array(words, dtype=np.int64), np.repeat(np.arange(len(lengths)), lengths)
+
+
+def _encoded_cooccurance_blocks(ids, offsets, block):
+    """ as _cooccurance_blocks, for the arrays of Vocabulary.encode_sentences """
+    lengths = np.diff(offsets)
+    first = 0
+    while first < len(lengths):
+        last = int(np.searchsorted(offsets, offsets[first] + block, side='right'))
+        last = min(max(last - 1, first + 1), len(lengths))
+        yield (ids[offsets[first]:offsets[last]].astype(np.int64),
+               np.repeat(np.arange(first, last), lengths[first:last]))
+        first = last
+
+
+def sparse_cooccurance_matrix(window, tokens, sentences=None, weighting=None, symmetric=False,
+                              dtype=np.float64, block=1000000, encoded=None):
+    """ co-occurance matrix built in one pass over the sentences
+    Input: window, tokens (list of words, dict of word to id or Vocabulary),
+           sentences (iterable of lists of words),
+           weighting None for counts, 'harmonic' for 1/distance or a function of distance,
+           symmetric to only store the upper triangle, dtype of the values,
+           block number of words handled at once,
+           encoded the (ids, offsets) arrays of Vocabulary.encode_sentences
+           with unknown=-1, given instead of sentences
+    Output: scipy.sparse csr matrix, row and column i are tokens[i]
+
+    NB same counts as build_cooccurance_matrix but only the pairs that
+       occur are stored, eg a 50k word vocabulary is not 20GB dense.
+    NB the full matrix is symmetric; with symmetric=True only entries
+       i <= j are kept, and the full matrix is X + X.T - diag(X).
+    NB words missing from tokens are skipped but still take up room in
+       the window.
+    NB for embeddings, a truncated SVD with scipy.sparse.linalg.svds(X, k)
+       works directly on the result.
+
+    >>> X = sparse_cooccurance_matrix(1, ['I', 'like', 'NLP', 'problems'], [['I','like','NLP'],['I','like','NLP','problems']])
+    >>> X.toarray().tolist()
+    [[0.0, 2.0, 0.0, 0.0], [2.0, 0.0, 2.0, 0.0], [0.0, 2.0, 0.0, 1.0], [0.0, 0.0, 1.0, 0.0]]
+    >>> X = sparse_cooccurance_matrix(2, ['I', 'like', 'NLP'], [['I','like','NLP']], weighting='harmonic', symmetric=True)
+    >>> X.toarray().tolist()
+    [[0.0, 1.0, 0.5], [0.0, 0.0, 1.0], [0.0, 0.0, 0.0]]
+    """
+    from scipy import sparse
+    if isinstance(tokens, Vocabulary):
+        ids = tokens.ids
+    else:
+        ids = tokens if isinstance(tokens, dict) else {w: i for i, w in enumerate(tokens)}
+    size = max(ids.values()) + 1 if ids else 0
+    if weighting == 'harmonic':
+        weighting = lambda d: 1.0 / d
+    if (sentences is None) == (encoded is None):
+        raise ValueError("give either sentences or encoded sentences")
+    if encoded is not None:
+        blocks = _encoded_cooccurance_blocks(*encoded, block=block)
+    else:
+        blocks = _cooccurance_blocks(ids, sentences, block)
+    matrix = sparse.csr_matrix((size, size), dtype=dtype)
+    for words, sentence in blocks:
+        rows, cols, values = [], [], []
+        for d in range(1, window+1):
+            keep = (sentence[:-d] == sentence[d:]) & (words[:-d] >= 0) & (words[d:] >= 0)
+            a, b = words[:-d][keep], words[d:][keep]
+            weight = weighting(d) if weighting else 1.0
+            if symmetric:
+                # a pair of the same word sits on the diagonal twice
+                rows.append(np.minimum(a, b))
+                cols.append(np.maximum(a, b))
+                values.append(np.where(a == b, 2.0 * weight, weight))
+            else:
+                rows.extend((a, b))
+                cols.extend((b, a))
+                values.extend((np.full(len(a), weight), np.full(len(a), weight)))
+        if rows:
+            coo = sparse.coo_matrix((np.concatenate(values).astype(dtype),
+                                     (np.concatenate(rows), np.concatenate(cols))), shape=(size, size))
+            matrix = matrix + coo.tocsr()
+    return matrix
+
+
 def build_cooccurance_matrix(window, tokens, sentences):
     """ build co-occurance matrix
     if X is the co-occurance matrix, it can easily be decomposed with SVD
            X = USV^T
     with numpy:
             U, s, Vh =  np.linalg.svd(X, full_matrices=False)
-    """
-    m = np.zeros((len(tokens),len(tokens)))
-    for i,token_i in enumerate(tokens):
-        for j,token_j in enumerate(tokens):
-            m[i][j] = get_cooccurance_count(window, token_i,token_j, sentences)
-    return m
-
 
+    NB dense version of sparse_cooccurance_matrix, use that for a large vocabulary
 
+    >>> build_cooccurance_matrix(1, ['I', 'like', 'NLP'], [['I','like','NLP'],['I','like','NLP','problems']]).tolist()
+    [[0.0, 2.0, 0.0], [2.0, 0.0, 2.0], [0.0, 2.0, 0.0]]
+    """
+    return sparse_cooccurance_matrix(window, tokens, sentences).toarray()
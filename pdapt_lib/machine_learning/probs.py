@@ -10,14 +10,51 @@
     basics
 
 """
-from pdapt_lib.machine_learning.maths import sum_of_squares, dot, factorial
+from pdapt_lib.machine_learning.maths import sum_of_squares, dot, factorial, log_factorial, range_product
+import numpy as np
+import operator
 
 
-def choose(n,k):
-    """ n choose k
+def choose(n, k):
+    """ n choose k, exact
     # example, say want to know ways to form committee of 3 students from 20 total students
     >>> choose(20,3)
+    1140
+    >>> choose(200, 100) == factorial(200) // factorial(100)**2
+    True
+
+    NB the multiplicative formula, result * (n-k+i) // i for i up to k,
+       is exact at every step; for large k the product n-k+1 ... n is
+       split into halves instead and divided by k! once.
+    NB n and k must be integers (int or numpy integer); floats such as
+       20.0, accepted before, raise TypeError.
+    """
+    n, k = operator.index(n), operator.index(k)
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    if k <= 64:
+        result = 1
+        for i in range(1, k + 1):
+            result = result * (n - k + i) // i
+        return result
+    return range_product(n - k + 1, n + 1) // factorial(k)
+
+
+def log_choose(n, k):
+    """ natural log of n choose k, for numbers or arrays, -inf for k
+    outside 0 ... n
+    >>> round(float(np.exp(log_choose(20, 3))), 6)
     1140.0
+    >>> np.exp(log_choose(np.array([20, 20, 20]), np.array([0, 3, 21]))).round(6).tolist()
+    [1.0, 1140.0, 0.0]
+
+    NB for n far above k the three log factorials nearly cancel, so the
+       result has an absolute error around 1e-16 * n log n.
     """
-    return factorial(n) / (factorial(k)*factorial(n-k))
+    n, k = np.asarray(n), np.asarray(k)
+    inside = (k >= 0) & (k <= n)
+    n, k = np.where(inside, n, 0), np.where(inside, k, 0)
+    result = np.where(inside, log_factorial(n) - log_factorial(k) - log_factorial(n - k), -np.inf)
+    return float(result) if result.ndim == 0 else result
 
@@ -0,0 +1,258 @@
+#  sketch.py
+#
+#  Author: Matthew K. MacLeod
+#
+#  For license information see license.txt
+
+""" Sketch
+
+  approximate token counting in constant memory: a Count-Min sketch
+  for the counts and Space-Saving for the most frequent tokens
+
+"""
+from pdapt_lib.machine_learning.nlp import preprocess, n_gram
+from pdapt_lib.machine_learning.corpus import read_documents
+from hashlib import blake2b
+import heapq
+import math
+import numpy as np
+
+
+class CountMinSketch(object):
+    """ Count-Min sketch of token counts
+    Input: epsilon and delta error bounds, or width and depth directly, seed
+
+    NB an estimate is never below the true count, and with probability
+       1 - delta it is at most epsilon * total above it; this needs
+       width = ceil(e / epsilon) and depth = ceil(ln(1 / delta)).
+    NB memory is the width * depth table, however many tokens are counted.
+    NB sketches with the same width, depth and seed can be merged.
+
+    >>> sketch = CountMinSketch(epsilon=0.01, delta=0.01)
+    >>> sketch.width, sketch.depth
+    (272, 5)
+    >>> sketch.update_many(tokenize_words("the rain in Spain falls mainly in Spain"))
+    >>> sketch['spain'], sketch['rain'], sketch.total
+    (2, 1, 8)
+    """
+    def __init__(self, epsilon=0.001, delta=0.01, width=None, depth=None, seed=0):
+        self.width = width or int(math.ceil(math.e / epsilon))
+        self.depth = depth or int(math.ceil(math.log(1.0 / delta)))
+        self.seed = seed
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+        self._rows = np.arange(self.depth, dtype=np.uint64)
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+
+    def _columns(self, tokens):
+        """ (len(tokens), depth) array of table columns
+
+        NB two 64 bit hashes per token, combined as h1 + i*h2 for row i
+        """
+        key = str(self.seed).encode()
+        digests = b"".join(blake2b(t.encode('utf-8'), digest_size=16, key=key).digest() for t in tokens)
+        h = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+        return ((h[:, :1] + self._rows * h[:, 1:]) % np.uint64(self.width)).astype(np.intp)
+
+    def update(self, token, count=1):
+        self.table[np.arange(self.depth), self._columns([token])[0]] += count
+        self.total += count
+
+    def update_many(self, tokens):
+        """ count an iterable of tokens, or add a dictionary of token counts """
+        if hasattr(tokens, 'items'):
+            tokens, counts = list(tokens.keys()), np.fromiter(tokens.values(), dtype=np.int64)
+        else:
+            tokens = list(tokens)
+            counts = np.ones(len(tokens), dtype=np.int64)
+        if not tokens:
+            return
+        np.add.at(self.table, (np.arange(self.depth), self._columns(tokens)), counts[:, None])
+        self.total += int(counts.sum())
+
+    def __getitem__(self, token):
+        return int(self.table[np.arange(self.depth), self._columns([token])[0]].min())
+
+    def merge(self, other):
+        """ new sketch counting the tokens of both """
+        if (other.width, other.depth, other.seed) != (self.width, self.depth, self.seed):
+            raise ValueError("can only merge sketches with the same width, depth and seed")
+        merged = CountMinSketch(width=self.width, depth=self.depth, seed=self.seed)
+        merged.table = self.table + other.table
+        merged.total = self.total + other.total
+        return merged
+
+
+class SpaceSaving(object):
+    """ Space-Saving tracker of the k most frequent tokens
+    Input: k, the number of tokens kept
+
+    NB when a new token arrives and k are kept, the token with the smallest
+       count is replaced, and the new one inherits that count.  Counts are
+       therefore never below the true count and at most total/k above it
+       (the error attribute holds the bound for each token), and every token
+       occurring more than total/k times is kept.
+
+    >>> tracker = SpaceSaving(3)
+    >>> for w in "a b a c a b a d b a".split():
+    ...     tracker.update(w)
+    >>> tracker.top()
+    [('a', 5), ('b', 3), ('d', 2)]
+    >>> tracker.errors['d']
+    1
+    """
+    def __init__(self, k):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []  # (count, token), counts may be out of date
+
+    def _smallest(self):
+        """ token with the smallest count, brings the heap up to date """
+        while True:
+            c, token = self._heap[0]
+            if self.counts[token] == c:
+                return token
+            heapq.heapreplace(self._heap, (self.counts[token], token))
+
+    def update(self, token, count=1):
+        self.total += count
+        if token in self.counts:
+            self.counts[token] += count
+        elif len(self.counts) < self.k:
+            self.counts[token], self.errors[token] = count, 0
+            heapq.heappush(self._heap, (count, token))
+        else:
+            smallest = self._smallest()
+            c = self.counts.pop(smallest)
+            del self.errors[smallest]
+            self.counts[token], self.errors[token] = c + count, c
+            heapq.heapreplace(self._heap, (c + count, token))
+
+    def update_many(self, tokens):
+        """ count an iterable of tokens, or add a dictionary of token counts """
+        for token, count in (tokens.items() if hasattr(tokens, 'items') else ((t, 1) for t in tokens)):
+            self.update(token, count)
+
+    def __getitem__(self, token):
+        return self.counts.get(token, 0)
+
+    def top(self, k=None):
+        """ up to k (token, count) pairs, largest count first """
+        ranked = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+        return ranked[:k] if k is not None else ranked
+
+    def merge(self, other):
+        """ new tracker for the tokens of both
+
+        NB a token missing from a full tracker may have occurred up to its
+           smallest count times, which is added to keep counts upper bounds.
+        """
+        merged = SpaceSaving(max(self.k, other.k))
+        floor_a = min(self.counts.values()) if len(self.counts) >= self.k else 0
+        floor_b = min(other.counts.values()) if len(other.counts) >= other.k else 0
+        candidates = []
+        for token in set(self.counts) | set(other.counts):
+            count, error = 0, 0
+            for tracker, floor in ((self, floor_a), (other, floor_b)):
+                if token in tracker.counts:
+                    count += tracker.counts[token]
+                    error += tracker.errors[token]
+                else:
+                    count += floor
+                    error += floor
+            candidates.append((count, error, token))
+        candidates.sort(key=lambda x: (-x[0], x[2]))
+        for count, error, token in candidates[:merged.k]:
+            merged.counts[token], merged.errors[token] = count, error
+        merged._heap = [(c, t) for t, c in merged.counts.items()]
+        heapq.heapify(merged._heap)
+        merged.total = self.total + other.total
+        return merged
+
+
+class ApproximateCounts(object):
+    """ Count-Min counts with Space-Saving heavy hitters
+    Input: k heavy hitters to track, Count-Min epsilon, delta and seed
+
+    NB counts from a CountMinSketch, top() from a SpaceSaving tracker
+       ordered by the sketch estimates, both in fixed memory.
+
+    >>> counts = ApproximateCounts(k=2, epsilon=0.01)
+    >>> counts.update_many(tokenize_words("the rain in Spain falls mainly in Spain"))
+    >>> counts['in'], counts.top()
+    (2, [('in', 2), ('spain', 2)])
+    """
+    def __init__(self, k=100, epsilon=0.001, delta=0.01, seed=0):
+        self.sketch = CountMinSketch(epsilon, delta, seed=seed)
+        self.heavy = SpaceSaving(k)
+
+    @property
+    def total(self):
+        return self.sketch.total
+
+    def update(self, token, count=1):
+        self.sketch.update(token, count)
+        self.heavy.update(token, count)
+
+    def update_many(self, tokens):
+        """ count an iterable of tokens, or add a dictionary of token counts """
+        if not hasattr(tokens, 'items'):
+            tokens = list(tokens)
+        self.sketch.update_many(tokens)
+        self.heavy.update_many(tokens)
+
+    def __getitem__(self, token):
+        return self.sketch[token]
+
+    def top(self, k=None):
+        """ up to k (token, estimated count) pairs of the most frequent tokens """
+        ranked = sorted(((t, self.sketch[t]) for t in self.heavy.counts), key=lambda x: (-x[1], x[0]))
+        return ranked[:k] if k is not None else ranked
+
+    def merge(self, other):
+        merged = ApproximateCounts.__new__(ApproximateCounts)
+        merged.sketch = self.sketch.merge(other.sketch)
+        merged.heavy = self.heavy.merge(other.heavy)
+        return merged
+
+
+def tokenize_words(s, n=1, removing_stopwords=False, stemming=False):
+    """ the n-grams tokenize(s, n) counts, as a list
+
+    >>> tokenize_words("the rain in Spain", 2)
+    ['the rain', 'rain in', 'in spain']
+    """
+    return n_gram(n, preprocess(s, removing_stopwords, stemming))
+
+
+def approximate_tokenize(source, n=1, removing_stopwords=False, stemming=False,
+                         k=100, epsilon=0.001, delta=0.01, seed=0, chunk_size=None):
+    """ approximate token counts of a corpus in constant memory
+    Input: source as for corpus.read_documents, tokenize options, number of
+           heavy hitters k, Count-Min error bounds epsilon and delta, seed
+    Output: ApproximateCounts of all ngram tokens
+
+    NB use this instead of corpus.count_corpus when the vocabulary does not
+       fit in memory; the results of workers using the same k, epsilon,
+       delta and seed can be combined with merge.
+
+    >>> counts = approximate_tokenize(["the rain in Spain", "falls mainly in Spain"], 2, k=3)
+    >>> counts['in spain'], counts.top(1)
+    (2, [('in spain', 2)])
+    """
+    counts = ApproximateCounts(k, epsilon, delta, seed)
+    for doc in read_documents(source, chunk_size):
+        tokens = {}
+        for w in tokenize_words(doc, n, removing_stopwords, stemming):
+            tokens[w] = tokens.get(w, 0) + 1
+        counts.update_many(tokens)
+    return counts
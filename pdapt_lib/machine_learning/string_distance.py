@@ -0,0 +1,178 @@
+#  string_distance.py
+#
+#  Author: Matthew K. MacLeod
+#
+#  For license information see license.txt
+
+""" String distance
+
+  batch Hamming distances between fixed length strings (barcodes,
+  hashes) and banded Levenshtein distances between any strings
+
+"""
+from itertools import combinations
+import numpy as np
+
+
+def encode_strings(strings):
+    """ fixed length strings as a character matrix
+    Input: list of strings, all of the same length
+    Output: (number of strings, length) uint8 array of character codes,
+            uint32 if any character is outside latin-1
+
+    >>> encode_strings(['ACGT', 'ACGA']).tolist()
+    [[65, 67, 71, 84], [65, 67, 71, 65]]
+    """
+    strings = list(strings)
+    length = len(strings[0]) if strings else 0
+    if any(len(s) != length for s in strings):
+        raise ValueError("strings must all have the same length")
+    try:
+        codes = np.frombuffer("".join(strings).encode('latin-1'), dtype=np.uint8)
+    except UnicodeEncodeError:
+        codes = np.array([ord(c) for s in strings for c in s], dtype=np.uint32)
+    return codes.reshape(len(strings), length)
+
+
+def _as_codes(X):
+    return X if isinstance(X, np.ndarray) else encode_strings(X)
+
+
+def hamming_matrix(X, Y=None, block=1024):
+    """ Hamming distances between all pairs of strings
+    Input: strings or encoded matrix X, optional Y (default X), rows per block
+    Output: (len(X), len(Y)) int32 array of distances
+
+    NB rows of X are taken a block at a time and compared with Y one
+       position at a time, so memory is a block of the output.
+
+    >>> hamming_matrix(['kathrin', 'karolin', 'kerstin']).tolist()
+    [[0, 3, 4], [3, 0, 3], [4, 3, 0]]
+    """
+    X = _as_codes(X)
+    Y = X if Y is None else _as_codes(Y)
+    if X.shape[1] != Y.shape[1]:
+        raise ValueError("strings of X and Y must have the same length")
+    D = np.empty((len(X), len(Y)), dtype=np.int32)
+    for start in range(0, len(X), block):
+        rows = X[start:start+block]
+        out = D[start:start+block]
+        out[...] = 0
+        for j in range(X.shape[1]):
+            out += rows[:, j, None] != Y[None, :, j]
+    return D
+
+
+def hamming_to_many(s, Y):
+    """ Hamming distances from one string to many
+
+    >>> hamming_to_many('kathrin', ['karolin', 'kerstin']).tolist()
+    [3, 4]
+    """
+    return hamming_matrix([s], Y)[0]
+
+
+def hamming_pairs(X, k, block=1024):
+    """ pairs of strings within Hamming distance k
+    Input: strings or encoded matrix X, maximum distance k
+    Output: sorted list of (i, j, distance) with i < j
+
+    NB by the pigeonhole principle, two strings that differ in at most k
+       positions agree exactly on one of any k+1 segments; only strings
+       sharing a segment are compared.  When k+1 exceeds the length every
+       pair is compared, block by block.
+
+    >>> hamming_pairs(['ACGTAC', 'ACGTTC', 'TTTTTT', 'ACGAAC'], 1)
+    [(0, 1, 1), (0, 3, 1)]
+    """
+    X = _as_codes(X)
+    n, length = X.shape
+    if k + 1 > length:
+        D = hamming_matrix(X, block=block)
+        i, j = np.nonzero(np.triu(D <= k, 1))
+        return list(zip(i.tolist(), j.tolist(), D[i, j].tolist()))
+    bounds = np.linspace(0, length, k + 2).astype(int)
+    candidates = set()
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        segment = np.ascontiguousarray(X[:, a:b]).view(np.dtype((np.void, (b - a) * X.itemsize)))
+        _, group, sizes = np.unique(segment.ravel(), return_inverse=True, return_counts=True)
+        order = np.argsort(group, kind='stable')
+        ends = np.cumsum(sizes)
+        for size, end in zip(sizes, ends):
+            if size > 1:
+                candidates.update(combinations(order[end-size:end].tolist(), 2))
+    if not candidates:
+        return []
+    pairs = np.array(sorted(candidates), dtype=np.intp)
+    distance = np.count_nonzero(X[pairs[:, 0]] != X[pairs[:, 1]], axis=1)
+    keep = distance <= k
+    return list(zip(pairs[keep, 0].tolist(), pairs[keep, 1].tolist(), distance[keep].tolist()))
+
+
+def levenshtein(s, t, k=None):
+    """ edit distance, the number of insertions, deletions and substitutions
+    Input: strings s and t, optional maximum distance k of interest
+    Output: the distance, or k+1 if it is more than k
+
+    NB with k only the diagonal band |i - j| <= k of the table is filled,
+       and the computation stops once a row exceeds k: O(k * len) time.
+
+    >>> levenshtein('kitten', 'sitting')
+    3
+    >>> levenshtein('kitten', 'sitting', 2)
+    3
+    >>> levenshtein('flaw', 'lawn', 2)
+    2
+    """
+    if len(s) > len(t):
+        s, t = t, s
+    n, m = len(s), len(t)
+    if k is None:
+        k = m
+    if m - n > k:
+        return k + 1
+    cap = k + 1
+    previous = [min(j, cap) for j in range(m + 1)]
+    for i in range(1, n + 1):
+        current = [cap] * (m + 1)
+        lo, hi = max(1, i - k), min(m, i + k)
+        if lo == 1:
+            current[0] = min(i, cap)
+        best = current[0]
+        a = s[i-1]
+        for j in range(lo, hi + 1):
+            v = previous[j-1] + (a != t[j-1])
+            if previous[j] + 1 < v:
+                v = previous[j] + 1
+            if current[j-1] + 1 < v:
+                v = current[j-1] + 1
+            current[j] = v
+            if v < best:
+                best = v
+        if best > k:
+            return cap
+        previous = current
+    return min(previous[m], cap)
+
+
+def levenshtein_pairs(strings, k):
+    """ pairs of strings within edit distance k
+    Input: list of strings, maximum distance k
+    Output: sorted list of (i, j, distance) with i < j
+
+    NB strings are sorted by length and only compared with strings at most
+       k characters longer, each with a banded levenshtein.
+
+    >>> levenshtein_pairs(['kitten', 'sitting', 'mitten', 'fitting'], 1)
+    [(0, 2, 1), (1, 3, 1)]
+    """
+    order = sorted(range(len(strings)), key=lambda i: len(strings[i]))
+    pairs = []
+    for x, i in enumerate(order):
+        for j in order[x+1:]:
+            if len(strings[j]) - len(strings[i]) > k:
+                break
+            d = levenshtein(strings[i], strings[j], k)
+            if d <= k:
+                pairs.append((min(i, j), max(i, j), d))
+    return sorted(pairs)
@@ -0,0 +1,42 @@
+import math
+import unittest
+import numpy as np
+import pdapt_lib.machine_learning.nlp as nlp
+from pdapt_lib.machine_learning.classification import NaiveBayes
+
+DOCS = ["the rain in Spain falls mainly on the plain", "rain and wind all day", "wet and windy weather",
+        "a fine sunny day", "sunny and warm on the plain", "warm dry weather all week"]
+LABELS = ['wet', 'wet', 'wet', 'dry', 'dry', 'dry']
+
+
+class TestNaiveBayes(unittest.TestCase):
+
+    def test_multinomial_log_probabilities(self):
+        nb = NaiveBayes(alpha=0.5).fit(DOCS, LABELS)
+        priors, log_probs, bias = nb.tables()
+        wet = [nlp.tokenize(d) for d, l in zip(DOCS, LABELS) if l == 'wet']
+        total = sum(sum(t.values()) for t in wet)
+        for w in ('rain', 'plain', 'sunny'):
+            count = sum(t.get(w, 0) for t in wet)
+            expected = math.log((count + 0.5) / (total + 0.5*len(nb.vocabulary)))
+            self.assertAlmostEqual(log_probs[nb.class_index['wet'], nb.vocabulary[w]], expected)
+        self.assertTrue(np.allclose(priors, np.log([0.5, 0.5])))
+
+    def test_predict(self):
+        for kind in ('multinomial', 'bernoulli'):
+            nb = NaiveBayes(kind).fit(DOCS, LABELS)
+            self.assertEqual(nb.predict(["windy rain", "sunny week", "snow"])[:2], ['wet', 'dry'])
+            probabilities = np.exp(nb.predict_log_proba(DOCS))
+            self.assertTrue(np.allclose(probabilities.sum(axis=1), 1.0))
+            self.assertEqual(nb.predict([nlp.tokenize(d) for d in DOCS]), nb.predict(DOCS))
+
+    def test_partial_fit_matches_fit(self):
+        for kind in ('multinomial', 'bernoulli'):
+            whole = NaiveBayes(kind).fit(DOCS, LABELS)
+            online = NaiveBayes(kind)
+            for doc, label in zip(DOCS, LABELS):
+                online.partial_fit([doc], [label])
+            self.assertTrue(np.allclose(online.joint_log_likelihood(DOCS), whole.joint_log_likelihood(DOCS)))
+            self.assertTrue(np.allclose(NaiveBayes(kind).fit(iter(DOCS), iter(LABELS), batch=4).tables()[1],
+                                        whole.tables()[1]))
+        self.assertRaises(ValueError, NaiveBayes, 'gaussian')
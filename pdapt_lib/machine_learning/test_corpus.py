@@ -0,0 +1,109 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from functools import reduce
+import pdapt_lib.machine_learning.nlp as nlp
+import pdapt_lib.machine_learning.corpus as corpus
+
+TEXT = ["The rain in Spain falls mainly on the plain.",
+        "A simple version-2 of a tokenizer",
+        "It's 5 o'clock and the U.S. test isn't done!"]
+
+
+class TestCorpus(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as f:
+            f.write("\n".join(TEXT) + "\n")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_stream_tokenize_matches_tokenize(self):
+        for n in (1, 2, 3):
+            expected = [nlp.tokenize(doc, n) for doc in TEXT]
+            self.assertEqual(list(corpus.stream_tokenize(self.path, n)), expected)
+            with open(self.path) as f:
+                self.assertEqual(list(corpus.stream_tokenize(f, n)), expected)
+
+    def test_count_corpus(self):
+        expected = {}
+        for doc in TEXT:
+            expected = nlp.merge_tokens(expected, nlp.tokenize(doc, 2, True))
+        self.assertEqual(corpus.count_corpus(iter(TEXT), 2, True), expected)
+
+    def test_carry_over_chunks(self):
+        """ chunked and line by line reading agree when n-grams are carried """
+        with open(self.path, 'w') as f:
+            f.write("the rain in Spain falls\nmainly on the plain\nand nobody knows why\n")
+        by_line = corpus.count_corpus(self.path, 3, carry=True)
+        self.assertEqual(by_line, nlp.tokenize("the rain in Spain falls mainly on the plain and nobody knows why", 3))
+        for chunk_size in (1, 7, 64, 4096):
+            chunked = corpus.count_corpus(self.path, 3, carry=True, chunk_size=chunk_size)
+            self.assertEqual(chunked, by_line)
+
+    def test_parallel_tokenize_matches_serial(self):
+        docs = TEXT * 20
+        for n in (1, 2):
+            serial = {}
+            for doc in docs:
+                serial = nlp.merge_tokens(serial, nlp.tokenize(doc, n))
+            for processes, chunk_size in ((1, 7), (2, 1), (3, 16)):
+                parallel = corpus.parallel_tokenize(docs, n, processes=processes, chunk_size=chunk_size)
+                self.assertEqual(parallel, serial)
+
+    def test_tree_merge(self):
+        shards = [nlp.tokenize(doc, 1) for doc in TEXT * 5]
+        folded = {}
+        for tokens in shards:
+            folded = nlp.merge_tokens(folded, tokens)
+        self.assertEqual(corpus.tree_merge(shards), folded)
+        self.assertEqual(shards[0], nlp.tokenize(TEXT[0], 1))
+        self.assertEqual(corpus.tree_merge([]), {})
+
+
+class TestMerging(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(0)
+        words = ["w%d" % i for i in range(300)]
+        self.shards = [nlp.tokenize(" ".join(rng.choice(words) for _ in range(rng.randint(0, 40))))
+                       for _ in range(50)]
+        self.expected = reduce(nlp.merge_tokens, self.shards, {})
+
+    def test_merge_many(self):
+        self.assertEqual(nlp.merge_many(self.shards), self.expected)
+        total = {}
+        for tokens in self.shards:
+            nlp.accumulate_tokens(total, tokens)
+        self.assertEqual(total, self.expected)
+        self.assertEqual(nlp.merge_many([]), {})
+
+    def test_merge_count_files(self):
+        folder = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(folder, "shard%d" % i) for i in range(len(self.shards))]
+            for path, tokens in zip(paths, self.shards):
+                corpus.write_counts(tokens, path)
+            out = os.path.join(folder, "total")
+            corpus.merge_count_files(paths, out, fan_in=4)
+            merged = list(corpus.read_counts(out))
+            self.assertEqual(merged, sorted(self.expected.items()))
+            self.assertEqual(len(os.listdir(folder)), len(paths) + 1)
+        finally:
+            shutil.rmtree(folder)
+
+    def test_count_file_separators(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "counts")
+            tokens = {'the rain': 2, 'in spain': 1, 'café': 3}
+            corpus.write_counts(tokens, path)
+            self.assertEqual(dict(corpus.read_counts(path)), tokens)
+            for bad in ('a\tb', 'a\nb', 'a\rb'):
+                self.assertRaises(ValueError, corpus.write_counts, {bad: 1}, path)
+        finally:
+            shutil.rmtree(folder)
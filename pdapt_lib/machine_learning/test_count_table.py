@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+import pdapt_lib.machine_learning.nlp as nlp
+import pdapt_lib.machine_learning.corpus as corpus
+from pdapt_lib.machine_learning.count_table import CountTable, write_count_table
+
+TEXT = "The rain in Spain falls mainly on the plain, and the rain in Wales falls too. Ça va?"
+
+
+def lookup(args):
+    table, token = args
+    return table.get(token)
+
+
+class TestCountTable(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'table.ct')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        for n in (1, 2, 3):
+            tokens = nlp.tokenize(TEXT, n)
+            write_count_table(tokens, self.path)
+            table = CountTable(self.path)
+            self.assertEqual(len(table), len(tokens))
+            self.assertEqual(table.to_tokens(), tokens)
+            self.assertEqual(list(table.keys()), sorted(tokens))
+            for token, count in tokens.items():
+                self.assertEqual(table[token], count)
+                self.assertEqual(table.token(table.index(token)), token)
+            self.assertNotIn('snow', table)
+            self.assertRaises(KeyError, lambda: table['snow'])
+        self.assertEqual(list(table.items_with_prefix('the rain')), [('the rain in', 2)])
+
+    def test_from_merged_count_files(self):
+        docs = TEXT.split(",")
+        paths = [os.path.join(self.folder, "shard%d" % i) for i in range(len(docs))]
+        for path, doc in zip(paths, docs):
+            corpus.write_counts(nlp.tokenize(doc, 2), path)
+        write_count_table(corpus.iter_merged_counts(paths), self.path)
+        expected = nlp.merge_many(nlp.tokenize(doc, 2) for doc in docs)
+        self.assertEqual(CountTable(self.path).to_tokens(), expected)
+        self.assertRaises(ValueError, write_count_table, [('b', 1), ('a', 1)], self.path)
+
+    def test_shared_with_workers(self):
+        tokens = nlp.tokenize(TEXT)
+        write_count_table(tokens, self.path)
+        table = CountTable(self.path)
+        with multiprocessing.Pool(2) as pool:
+            counts = pool.map(lookup, [(table, token) for token in tokens])
+        self.assertEqual(counts, list(tokens.values()))
+
+    def test_rewrite_while_open(self):
+        write_count_table({'rain': 2, 'spain': 1}, self.path)
+        with CountTable(self.path) as old:
+            write_count_table({'snow': 3}, self.path)
+            self.assertEqual(old['rain'], 2)
+            self.assertEqual(old.to_tokens(), {'rain': 2, 'spain': 1})
+            with CountTable(self.path) as new:
+                self.assertEqual(new.to_tokens(), {'snow': 3})
+        self.assertIsNone(old._map)
+        old.close()
+        self.assertEqual(os.listdir(self.folder), ['table.ct'])
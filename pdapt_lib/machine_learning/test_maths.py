@@ -12,5 +12,155 @@ class TestSpectra(unittest.TestCase):
     def test_factorial(self):
        self.assertEqual(maths.factorial(5), 120)
 
+    def test_large_factorial(self):
+       expected = 1
+       for n in range(1, 3001):
+          expected *= n
+          if n in (1, 100, 101, 255, 256, 1023, 3000):
+             self.assertEqual(maths.factorial(n), expected)
+       self.assertEqual(maths.factorial(0), 1)
+       self.assertRaises(ValueError, maths.factorial, -1)
+
+    def test_log_factorial(self):
+       self.assertAlmostEqual(maths.log_factorial(170), maths.math.log(float(maths.factorial(170))))
+       maths.np.testing.assert_allclose(maths.log_factorial(maths.np.arange(5)), maths.np.log([1, 1, 2, 6, 24]), atol=1e-12)
+
     def test_dihedral(self):
             self.assertEqual(maths.dihedral([-2.498019,2.157814,-1.513401],[-2.974569,3.029520,-1.062112],[-3.317570,2.819690,0.802274],[-3.629337,4.650860,1.235025]),164.23895763720364)
+
+
+class TestBackend(unittest.TestCase):
+
+    def setUp(self):
+        state = maths.np.random.RandomState(0)
+        self.V = state.normal(size=(5, 4))
+        self.W = state.normal(size=(5, 4))
+
+    def test_default_backend(self):
+        self.assertEqual(maths.get_backend(), 'python')
+        self.assertRaises(ValueError, maths.set_backend, 'fortran')
+
+    def test_numpy_matches_python(self):
+        v, w = self.V[0].tolist(), self.W[0].tolist()
+        expected = [maths.dot(v, w), maths.sum_of_squares(v), maths.magnitude(v), maths.distance(v, w),
+                    maths.vector_sum([v, w]), maths.vector_add(v, w), maths.vector_subtract(v, w),
+                    maths.scalar_multiply(2.5, v), maths.vector_sum([v, w], componentwise=True),
+                    maths.vector_mean([v, w], componentwise=True), maths.get_column([v, w], 1),
+                    maths.make_matrix(2, 3, maths.is_diagonal)]
+        with maths.using_backend('numpy'):
+            result = [maths.dot(v, w), maths.sum_of_squares(v), maths.magnitude(v), maths.distance(v, w),
+                      maths.vector_sum([v, w]), maths.vector_add(v, w), maths.vector_subtract(v, w),
+                      maths.scalar_multiply(2.5, v), maths.vector_sum([v, w], componentwise=True),
+                      maths.vector_mean([v, w], componentwise=True), maths.get_column([v, w], 1),
+                      maths.make_matrix(2, 3, maths.is_diagonal)]
+        self.assertEqual(maths.get_backend(), 'python')
+        for a, b in zip(expected, result):
+            maths.np.testing.assert_allclose(b, a, rtol=1e-12)
+
+    def test_batches(self):
+        with maths.using_backend('numpy'):
+            dots = maths.dot(self.V, self.W)
+            distances = maths.distance(self.V, self.W)
+            magnitudes = maths.magnitude(self.V)
+            means = maths.vector_mean(maths.np.stack([self.V, self.W], axis=1), componentwise=True)
+        for i in range(len(self.V)):
+            v, w = self.V[i].tolist(), self.W[i].tolist()
+            self.assertAlmostEqual(dots[i], maths.dot(v, w))
+            self.assertAlmostEqual(distances[i], maths.distance(v, w))
+            self.assertAlmostEqual(magnitudes[i], maths.magnitude(v))
+        maths.np.testing.assert_allclose(means, (self.V + self.W) / 2)
+
+    def test_legacy_vector_sum(self):
+        for backend in ('python', 'numpy'):
+            with maths.using_backend(backend):
+                self.assertEqual(maths.vector_sum([[1, 2, 3], [1, 2, 3]]), 12)
+                self.assertRaises(TypeError, maths.vector_mean, [[1, 2, 3], [1, 2, 3]])
+
+    def test_backends_agree(self):
+        calls = [(maths.vector_add, ([1, 2, 3], [4, 5, 6])), (maths.vector_subtract, ([1, 2, 3], [4, 5, 6])),
+                 (maths.scalar_multiply, (2.0, [1, 2, 3])), (maths.dot, ([0, 2.0, 4], [0, 1, 1])),
+                 (maths.sum_of_squares, ([1, 2, 3],)), (maths.magnitude, ([3, 4],)),
+                 (maths.distance, ([1.2, 2.2, 3.8], [1.0, 2.0, 8.8])),
+                 (maths.vector_sum, ([[1, 2, 3], [1, 2, 3]],)),
+                 (lambda v: maths.vector_sum(v, componentwise=True), ([[1, 2, 3], [1, 2, 3]],)),
+                 (lambda v: maths.vector_mean(v, componentwise=True), ([[1, 2, 3], [3, 4, 5]],)),
+                 (maths.get_column, ([[1, 2], [3, 4]], 1)), (maths.make_matrix, (2, 2, maths.is_diagonal))]
+        for f, args in calls:
+            results = []
+            for backend in ('python', 'numpy'):
+                with maths.using_backend(backend):
+                    results.append(maths.np.asarray(f(*args)).tolist())
+            self.assertEqual(results[0], results[1])
+
+
+class TestPairwiseDistances(unittest.TestCase):
+
+    def setUp(self):
+        state = maths.np.random.RandomState(1)
+        self.X = state.normal(size=(9, 6))
+        self.Y = state.normal(size=(5, 6))
+        self.counts = state.randint(0, 3, size=(7, 6)).astype(float)
+
+    def assertMatchesScalar(self, X, Y, metric, D):
+        expected = [[metric(x, y) for y in Y] for x in X]
+        maths.np.testing.assert_allclose(D, expected, rtol=1e-9, atol=1e-12)
+
+    def test_metrics_match_scalar_functions(self):
+        with maths.np.errstate(divide='ignore', invalid='ignore'):
+            for metric, name in maths._pairwise_functions.items():
+                X = self.counts if name in ('jaccard', 'sorensen') else self.X
+                Y = X[:4] + 1 if name in ('jaccard', 'sorensen') else self.Y
+                self.assertMatchesScalar(X, Y, metric, maths.pairwise_distances(X, Y, name, block=4, threads=2))
+                self.assertMatchesScalar(X, X, metric, maths.pairwise_distances(X, metric=metric, block=4))
+
+    def test_symmetric_and_dtype(self):
+        D = maths.pairwise_distances(self.X, metric='cosine', dtype=maths.np.float32, block=4)
+        self.assertEqual(D.dtype, maths.np.float32)
+        maths.np.testing.assert_array_equal(D, D.T)
+        self.assertTrue(all(D[i, i] < 1e-6 for i in range(len(D))))
+        self.assertRaises(ValueError, maths.pairwise_distances, self.X, metric='cosine', dtype=int)
+        self.assertRaises(ValueError, maths.pairwise_distances, self.X, metric='chebyshev')
+
+    def test_asymmetric_function(self):
+        X = maths.np.arange(6.).reshape(3, 2)
+        f = lambda x, y: x[0] - y[0]
+        for block in (1, 2, 1024):
+            self.assertEqual(maths.pairwise_distances(X, metric=f, block=block, threads=1).tolist(),
+                             [[0, -2, -4], [2, 0, -2], [4, 2, 0]])
+
+    def test_identical_rows(self):
+        X = self.X + 1000.0
+        self.assertEqual(maths.pairwise_distances(X, X[:3])[[0, 1, 2], [0, 1, 2]].tolist(), [0.0, 0.0, 0.0])
+
+    def test_blocks_of_rows(self):
+        D = maths.pairwise_distances(self.X, self.Y, 'braycurtis')
+        blocks = list(maths.iter_pairwise_distances(self.X, self.Y, 'braycurtis', block=4))
+        self.assertEqual([start for start, B in blocks], [0, 4, 8])
+        maths.np.testing.assert_allclose(maths.np.vstack([B for start, B in blocks]), D)
+
+
+class TestBatchGeometry(unittest.TestCase):
+
+    def setUp(self):
+        self.points = maths.np.random.RandomState(4).normal(size=(200, 4, 3)) * 3
+
+    def test_dihedrals(self):
+        expected = [maths.dihedral(*p.tolist()) for p in self.points]
+        maths.np.testing.assert_allclose(maths.dihedrals(self.points), expected, rtol=0, atol=1e-10)
+        maths.np.testing.assert_allclose(maths.dihedrals(*self.points.transpose(1, 0, 2)), expected, rtol=0, atol=1e-10)
+        self.assertAlmostEqual(maths.dihedrals([[-2.498019,2.157814,-1.513401],[-2.974569,3.029520,-1.062112],[-3.317570,2.819690,0.802274],[-3.629337,4.650860,1.235025]]), 164.23895763720364, places=10)
+
+    def test_point_angles(self):
+        expected = [maths.point_angle(*p[:3].tolist()) for p in self.points]
+        maths.np.testing.assert_allclose(maths.point_angles(self.points[:, :3]), expected, rtol=0, atol=1e-10)
+
+    def test_trajectory(self):
+        frames = self.points.reshape(50, 16, 3)
+        indices = [[0, 1, 2, 3], [4, 5, 6, 7], [3, 9, 12, 15]]
+        result = maths.dihedrals_of(frames, indices)
+        self.assertEqual(result.shape, (50, 3))
+        for f in (0, 49):
+            for k, i in enumerate(indices):
+                self.assertAlmostEqual(result[f, k], maths.dihedral(*frames[f, i].tolist()), places=10)
+        angles = maths.angles_of(frames, [[0, 1, 2]])
+        self.assertAlmostEqual(angles[7, 0], maths.point_angle(*frames[7, [0, 1, 2]].tolist()), places=10)
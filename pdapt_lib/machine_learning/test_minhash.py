@@ -0,0 +1,76 @@
+import os
+import random
+import tempfile
+import unittest
+import numpy as np
+import pdapt_lib.machine_learning.nlp as nlp
+import pdapt_lib.machine_learning.maths as maths
+from pdapt_lib.machine_learning.minhash import MinHash, LSHIndex
+
+
+def make_docs(count, seed=0):
+    """ random documents, every third one a light edit of the one before """
+    rng = random.Random(seed)
+    words = ["w%d" % i for i in range(500)]
+    docs = []
+    for i in range(count):
+        if i % 3 == 1:
+            doc = docs[-1].split(" ")
+            doc[rng.randrange(len(doc))] = rng.choice(words)
+            docs.append(" ".join(doc))
+        else:
+            docs.append(" ".join(rng.choice(words) for _ in range(60)))
+    return docs
+
+
+class TestMinHash(unittest.TestCase):
+
+    def setUp(self):
+        self.minhash = MinHash()
+        self.docs = make_docs(60)
+        self.signatures = self.minhash.signatures(self.docs, n=2)
+
+    def test_estimate_close_to_jaccard(self):
+        for i in range(0, 60, 3):
+            a, b = nlp.tokenize(self.docs[i], 2), nlp.tokenize(self.docs[i+1], 2)
+            exact = 1.0 - maths.jaccard_distance(a, b)
+            estimate = MinHash.jaccard(self.signatures[i], self.signatures[i+1])
+            self.assertLess(abs(estimate - exact), 0.2)
+
+    def test_union(self):
+        a, b = nlp.tokenize(self.docs[0], 2), nlp.tokenize(self.docs[2], 2)
+        both = self.minhash.signature(list(a) + list(b))
+        self.assertTrue(np.array_equal(MinHash.union(self.signatures[0], self.signatures[2]), both))
+
+    def test_near_duplicates(self):
+        index = LSHIndex(0.7)
+        for i, signature in enumerate(self.signatures):
+            index.add(i, signature)
+        found = [(a, b) for a, b, similarity in index.near_duplicates()]
+        self.assertEqual(found, [(i, i+1) for i in range(0, 60, 3)])
+
+    def test_merge_and_persist(self):
+        whole, shards = LSHIndex(0.7), [LSHIndex(0.7), LSHIndex(0.7)]
+        for i, signature in enumerate(self.signatures):
+            whole.add(i, signature)
+            shards[i >= 30].add(i, signature)
+        merged = shards[0].merge(shards[1])
+        handle, path = tempfile.mkstemp(suffix='.npz')
+        os.close(handle)
+        try:
+            merged.save(path)
+            loaded = LSHIndex.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(loaded.keys, whole.keys)
+        self.assertTrue(np.array_equal(loaded.signatures, whole.signatures))
+        self.assertEqual(loaded.near_duplicates(), whole.near_duplicates())
+        self.assertRaises(ValueError, whole.merge, LSHIndex(0.5))
+
+    def test_signature_types(self):
+        index = LSHIndex(0.7)
+        index.add('list', self.signatures[0].tolist())
+        index.add('int64', self.signatures[3].astype(np.int64))
+        self.assertEqual(index.query(self.signatures[0]), ['list'])
+        self.assertEqual(index.query(self.signatures[3]), ['int64'])
+        self.assertEqual(index.query(self.signatures[3].tolist()), ['int64'])
@@ -0,0 +1,81 @@
+import os
+import pickle
+import tempfile
+import unittest
+import numpy as np
+import pdapt_lib.machine_learning.maths as maths
+from pdapt_lib.machine_learning.neighbors import KDTree, BallTree, BruteForce, nearest_neighbors, _tree_metrics
+
+
+class TestNeighbors(unittest.TestCase):
+
+    def setUp(self):
+        state = np.random.RandomState(3)
+        self.X = state.normal(size=(500, 4))
+        self.X[250:260] = self.X[0]  # duplicates
+        self.Q = state.normal(size=(40, 4))
+
+    def assertNearest(self, index, metric, k=7):
+        distances, indices = index.query(self.Q, k, batch=16, threads=2)
+        D = maths.pairwise_distances(self.Q, self.X, metric)
+        np.testing.assert_allclose(distances, np.sort(D, axis=1)[:, :k], atol=1e-9)
+        np.testing.assert_allclose(D[np.arange(len(self.Q))[:, None], indices], distances, atol=1e-9)
+
+    def test_trees_match_brute_force(self):
+        for metric in _tree_metrics:
+            for cls in (KDTree, BallTree):
+                self.assertNearest(cls(self.X, metric, leaf_size=8), metric)
+        self.assertNearest(BruteForce(self.X, 'canberra', block=64), 'canberra')
+
+    def test_undefined_distances(self):
+        X = self.X[:240].copy()
+        X[7] = 0.0
+        X[200] = 2.5
+        for metric in ('cosine', 'pearson'):
+            brute = BruteForce(X, metric).query(self.Q, 5)
+            for cls in (KDTree, BallTree):
+                tree = cls(X, metric, leaf_size=8)
+                self.assertEqual(len(tree), len(X))
+                distances, indices = tree.query(self.Q, 5)
+                np.testing.assert_array_equal(indices, brute[1])
+                np.testing.assert_allclose(distances, brute[0], atol=1e-9)
+                radius = tree.query_radius(self.Q, 0.3)[1]
+                expected = BruteForce(X, metric).query_radius(self.Q, 0.3)[1]
+                self.assertEqual([i.tolist() for i in radius], [i.tolist() for i in expected])
+        distances, indices = KDTree(X[[7, 200, 1]], 'pearson').query(self.Q[:1], 3)
+        self.assertEqual(indices[0, 0], 2)
+        self.assertTrue(np.isnan(distances[0, 1:]).all())
+        self.assertRaises(ValueError, KDTree, X[[7]], 'cosine')
+
+    def test_radius(self):
+        tree = BallTree(self.X, 'cosine', leaf_size=8)
+        D = maths.pairwise_distances(self.Q, self.X, 'cosine')
+        distances, indices = tree.query_radius(self.Q, 0.05)
+        for q in range(len(self.Q)):
+            self.assertEqual(sorted(indices[q].tolist()), np.nonzero(D[q] <= 0.05)[0].tolist())
+            np.testing.assert_allclose(distances[q], np.sort(D[q][D[q] <= 0.05]), atol=1e-9)
+        brute = BruteForce(self.X, 'cosine').query_radius(self.Q, 0.05)
+        self.assertEqual([sorted(i.tolist()) for i in brute[1]], [sorted(i.tolist()) for i in indices])
+
+    def test_duplicates(self):
+        distances, indices = KDTree(self.X, leaf_size=4).query(self.X[:1], 11)
+        self.assertEqual(sorted(indices[0].tolist()), [0] + list(range(250, 260)))
+        self.assertEqual(distances[0].tolist(), [0.0] * 11)
+
+    def test_save_load_and_pickle(self):
+        tree = KDTree(self.X, 'pearson', leaf_size=8)
+        path = os.path.join(tempfile.mkdtemp(), 'tree.npz')
+        tree.save(path)
+        for copy in (KDTree.load(path), pickle.loads(pickle.dumps(tree))):
+            np.testing.assert_array_equal(copy.query(self.Q, 3)[1], tree.query(self.Q, 3)[1])
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+        self.assertFalse(tree.data.flags.writeable)
+
+    def test_choice_of_index(self):
+        self.assertIsInstance(nearest_neighbors(self.X), KDTree)
+        self.assertIsInstance(nearest_neighbors(np.ones((10, 20))), BallTree)
+        self.assertIsInstance(nearest_neighbors(self.X, 'braycurtis'), BruteForce)
+        self.assertRaises(ValueError, KDTree, self.X, 'jaccard')
+        self.assertRaises(ValueError, KDTree(self.X).query, self.Q, 501)
+        self.assertRaises(ValueError, KDTree, self.X, leaf_size=0)
@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import pdapt_lib.machine_learning.nlp as nlp
 
 class TestNLP(unittest.TestCase):
@@ -64,3 +65,196 @@ class TestNLP(unittest.TestCase):
 
 
 
+
+    def test_normalizer(self):
+        """ normalizer must match the processing chain it replaces """
+        texts = ["It's 5 o'clock, isn't it? I shan't go.",
+                 "The U.S.A. and the U.-K. test JAK-1 and Jak-2 at -12.5 degrees!",
+                 "i think i i can 1 2 3 do it rock'n'roll",
+                 "123 start, I ain't sure what's there's he's who's 4.5.",
+                 "A", "", "''", "I said 'hello' to G'day mate"]
+        normalizer = nlp.Normalizer()
+        for s in texts:
+            chain = nlp.expand(s)
+            chain = nlp.standardize_abbreviations(chain)
+            chain = nlp.remove_numbers(chain)
+            chain = nlp.lowercase(chain)
+            chain = nlp.uppercase_i(chain)
+            chain = nlp.remove_punctuation(chain)
+            self.assertEqual(normalizer.normalize(s), chain)
+
+    def test_anagram_index(self):
+        index = nlp.AnagramIndex()
+        for w in ['bird', 'listen', 'brid', 'silent', 'dirb', 'listen', 'tinsel']:
+            index.add(w)
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.anagrams_of('drib'), ['bird', 'brid', 'dirb'])
+        self.assertEqual(index.anagrams_of('zebra'), [])
+        self.assertEqual(sorted(map(sorted, index.anagram_groups())),
+                         [['bird', 'brid', 'dirb'], ['listen', 'silent', 'tinsel']])
+        self.assertEqual(index.pairs(), nlp.anagrams(['bird', 'listen', 'brid', 'silent', 'dirb', 'tinsel']))
+
+    def test_sparse_cooccurance_matrix(self):
+        sentences = [['the', 'rain', 'in', 'spain'], ['rain', 'in', 'the', 'plain', 'in', 'spain'], ['rain']]
+        vocabulary = nlp.tokens(sentences)
+        for window in (1, 2, 3):
+            X = nlp.sparse_cooccurance_matrix(window, vocabulary, sentences, block=3)
+            for i, a in enumerate(vocabulary):
+                for j, b in enumerate(vocabulary):
+                    self.assertEqual(X[i, j], nlp.get_cooccurance_count(window, a, b, sentences))
+
+    def test_cooccurance_of_sentence_tuples(self):
+        tokens = ['I', 'like', 'NLP']
+        for sentences in ((['I', 'like', 'NLP'], ['I', 'like', 'NLP', 'problems'], ['x']),
+                          (['I', 'like', 'NLP'], ['like', 'NLP'])):
+            self.assertEqual(nlp.build_cooccurance_matrix(1, tokens, sentences).tolist(),
+                             nlp.build_cooccurance_matrix(1, tokens, list(sentences)).tolist())
+        self.assertRaises(ValueError, nlp.sparse_cooccurance_matrix, 1, tokens)
+
+    def test_tfidf_vectorizer(self):
+        docs = [nlp.n_gram(1, nlp.preprocess(s)) for s in
+                ["the rain in Spain falls mainly on the plain", "the rain in Spain",
+                 "A simple version of a tokenizer", "rain rain go away"]]
+        vectorizer = nlp.TfidfVectorizer().partial_fit(docs[:2])
+        vectorizer.transform(docs[:1])
+        vectorizer.partial_fit(docs[2:])
+        X = vectorizer.transform(docs)
+        self.assertEqual(X.shape, (len(docs), len(vectorizer.terms)))
+        for i, doc in enumerate(docs):
+            for term, column in vectorizer.vocabulary.items():
+                expected = nlp.tfidf(term, doc, docs) if term in doc else 0.0
+                self.assertEqual(X[i, column], expected)
+        self.assertEqual(vectorizer.documents_with('rain'), [0, 1, 3])
+        self.assertEqual(vectorizer.documents_with('snow'), [])
+
+    def test_ngram_model(self):
+        text = "the rain in Spain falls mainly in Spain and the rain in Wales falls too"
+        bigrams = nlp.tokenize(text, 2)
+        model = nlp.NGramModel(bigrams)
+        for s in ['the', 'in', 'falls', 'wales', 'snow', 'over the']:
+            self.assertEqual(model.next_word(s), nlp.bigram_predict(bigrams, s))
+        trigrams = nlp.NGramModel(nlp.tokenize(text, 3))
+        self.assertEqual(trigrams.order, 3)
+        self.assertEqual(trigrams.predict('the rain', 5), ['in'])
+        self.assertEqual(trigrams.predict('in', 5), ['spain', 'wales'])
+        self.assertEqual(trigrams.predict('snow'), [])
+
+    def test_iter_sentences_long_text(self):
+        """ well past the recursion limit of the old recursive version """
+        text = "The U.S. is big. So is Canada! " * 5000 + "The end."
+        sentences = nlp.extract_sentences(text)
+        self.assertEqual(len(sentences), 10001)
+        self.assertEqual(sentences[:2], ['The U.S. is big.', 'So is Canada! '])
+        self.assertEqual([text[a:b] for a, b in nlp.iter_sentences(text, offsets=True)], sentences)
+
+    def test_stemmer(self):
+        words = "the thinking king was singing during the evening derivatives rapidly".split()
+        stemmer = nlp.Stemmer(maxsize=4)
+        self.assertEqual(stemmer.stem_many(words * 3), [nlp.stem(w) for w in words * 3])
+        self.assertEqual(stemmer.hits + stemmer.misses, 3 * len(words))
+        self.assertLessEqual(stemmer.stem.cache_info().currsize, 4)
+        stemmer.cache_clear()
+        self.assertEqual(stemmer.hit_rate(), 0.0)
+        s = " ".join(words)
+        self.assertEqual(stemmer.stem_string(s), " ".join(nlp.stem(w) for w in s.split(" ")))
+
+    def test_ngram_counts(self):
+        text = "the rain in Spain falls mainly in Spain and the rain in Wales falls too"
+        for n in range(1, 5):
+            tokens = nlp.tokenize(text, n)
+            counts = nlp.NGramCounts.from_text(text, n)
+            self.assertEqual(counts.to_tokens(), tokens)
+            self.assertEqual(nlp.NGramCounts.from_tokens(tokens).to_tokens(), tokens)
+            self.assertEqual(nlp.mean_token_occurance(counts), nlp.mean_token_occurance(tokens))
+        vocab = nlp.Vocabulary()
+        a = nlp.NGramCounts.from_text(text, 2, vocabulary=vocab)
+        b = nlp.NGramCounts.from_text("the rain stays", 2, vocabulary=vocab)
+        self.assertEqual(a.merge(b).to_tokens(), nlp.merge_tokens(a.to_tokens(), b.to_tokens()))
+        self.assertEqual(a.merge(b)['the rain'], 3)
+        self.assertRaises(ValueError, a.merge, nlp.NGramCounts.from_text(text, 2))
+        self.assertRaises(ValueError, nlp.NGramCounts.from_tokens, {'the rain': 1, 'rain': 1})
+
+    def test_ngram_counts_streaming(self):
+        docs = ["doc %d of the rain in Spain, falls %d" % (i, i % 7) for i in range(3000)]
+        counts, expected = nlp.NGramCounts(2), {}
+        for doc in docs:
+            counts.add_text(doc)
+            expected = nlp.accumulate_tokens(expected, nlp.tokenize(doc, 2))
+            if doc.startswith("doc 1000 "):
+                self.assertEqual(counts['the rain'], 1001)
+        self.assertEqual(counts.to_tokens(), expected)
+        short = nlp.NGramCounts(5)
+        for doc in ["a b c", "a", "", "a b c d e f", "a b c d"]:
+            short.add_text(doc)
+        self.assertEqual(short.to_tokens(), nlp.tokenize("a b c d e f", 5))
+        self.assertEqual(nlp.NGramCounts.from_text("a b c d", 6).to_tokens(), {})
+
+    def test_extract_features(self):
+        docs = ["The rain in Spain falls mainly on the plain. I saw her there!",
+                "Listen, he is silent. We enlist in the tinsel parade?",
+                "It's 5 o'clock and the U.S. test isn't done!"]
+        X = nlp.extract_features(docs)
+        self.assertEqual(X.shape, (len(docs), len(nlp.FEATURES)))
+        for row, doc in zip(X, docs):
+            tokens = nlp.tokenize(doc)
+            string_features = ('mean_sentence_length', 'mean_words_in_sentence')
+            expected = [getattr(nlp, name)(doc if name in string_features else tokens)
+                        for name in nlp.FEATURES]
+            self.assertEqual(row.tolist(), expected)
+        self.assertTrue(np.array_equal(nlp.extract_features(docs, processes=2, chunksize=1), X))
+        self.assertTrue(np.isnan(nlp.extract_features([""])[0, 0]))
+
+    def test_gram_iterators(self):
+        text = "the rain in Spain falls mainly on the plain"
+        for n in (1, 2, 3):
+            self.assertEqual(list(nlp.iter_ngrams(n, text, join=True)), nlp.n_gram(n, text))
+            self.assertEqual(list(nlp.iter_ngrams(n, iter(text.split(" ")))),
+                             [tuple(g.split(" ")) for g in nlp.n_gram(n, text)])
+        for k in (1, 2):
+            for n in (2, 3):
+                self.assertEqual(list(nlp.iter_skip_grams(k, n, text, join=True)), nlp.skip_gram(k, n, text))
+        vocab = nlp.Vocabulary()
+        ids = list(nlp.iter_ngrams(2, text, vocab))
+        self.assertEqual([" ".join(vocab.decode(g)) for g in ids], nlp.n_gram(2, text))
+        combined = nlp.tokenize(text, (1, 2, 3))
+        separate = {}
+        for n in (1, 2, 3):
+            separate = nlp.merge_tokens(separate, nlp.tokenize(text, n))
+        self.assertEqual(combined, separate)
+        self.assertEqual(nlp.tokenize(text, 2, k=1), nlp.tokenize(text, 2, k=(1,)))
+        skips = nlp.tokenize(text, (1, 2), k=(0, 1, 2))
+        self.assertEqual(skips['the'], 2)
+        self.assertEqual({w: c for w, c in skips.items() if " " not in w}, nlp.tokenize(text, 1))
+        self.assertEqual(skips, nlp.merge_tokens(nlp.tokenize(text, 1), nlp.merge_many(
+            nlp.tokenize(text, 2, k=k) for k in (0, 1, 2))))
+
+    def test_stopword_filter(self):
+        s = nlp.preprocess("The rain in Spain falls mainly on the plain, as it does in New York City")
+        self.assertEqual(nlp.StopwordFilter().remove(s), nlp.remove_stopwords(s))
+        custom = nlp.StopwordFilter(nlp.STOPWORDS, phrases=['new york', 'york city', 'mainly'])
+        self.assertEqual(custom.remove(s), 'rain spain falls plain does')
+        self.assertIn('mainly', custom)
+        self.assertEqual(nlp.StopwordFilter([]).remove(s), s)
+        overlapping = nlp.StopwordFilter([], phrases=['a b c', 'b c d', 'c'])
+        self.assertEqual(overlapping.remove('a b c d e b c f'), 'e b f')
+
+    def test_vocabulary_build(self):
+        sentences = [s.split(" ") for s in nlp.extract_sentences(
+            "The rain in Spain falls mainly on the plain. The rain in Wales falls too. So the plain is wet.")]
+        vocab = nlp.Vocabulary.build(sentences)
+        self.assertEqual(sorted(vocab.words), sorted(nlp.tokens(sentences)))
+        self.assertEqual(vocab.counts, sorted(vocab.counts, reverse=True))
+        self.assertEqual(vocab.words[:6], ['The', 'rain', 'in', 'falls', 'the', 'Spain'])
+        pruned = nlp.Vocabulary.build(sentences, min_count=2, max_size=4)
+        self.assertEqual(pruned.words, ['The', 'rain', 'in', 'falls'])
+        built = nlp.Vocabulary.build(sentences, min_count=2, max_size=4)
+        built.encode(['The', 'snow'])
+        self.assertEqual(built.counts, pruned.counts + [0])
+        ids, offsets = pruned.encode_sentences(sentences)
+        self.assertEqual(ids.dtype, np.int32)
+        self.assertEqual(len(offsets), len(sentences) + 1)
+        self.assertEqual(pruned.decode_sentences(ids, offsets),
+                         [[w for w in s if w in pruned] for s in sentences])
+        X = nlp.sparse_cooccurance_matrix(2, pruned, encoded=pruned.encode_sentences(sentences, unknown=-1))
+        Y = nlp.sparse_cooccurance_matrix(2, pruned.words, sentences)
+        self.assertEqual(X.toarray().tolist(), Y.toarray().tolist())
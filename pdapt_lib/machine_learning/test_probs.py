@@ -0,0 +1,31 @@
+import math
+import unittest
+import numpy as np
+from pdapt_lib.machine_learning.maths import factorial
+from pdapt_lib.machine_learning.probs import choose, log_choose
+
+
+class TestChoose(unittest.TestCase):
+
+    def test_exact(self):
+        for n in (0, 1, 7, 20, 171, 500):
+            for k in range(n + 1):
+                self.assertEqual(choose(n, k), factorial(n) // (factorial(k) * factorial(n - k)))
+        self.assertEqual(choose(5, 6), 0)
+        self.assertEqual(choose(5, -1), 0)
+        self.assertEqual(choose(np.int64(20), np.int32(3)), 1140)
+        self.assertRaises(TypeError, choose, 20.0, 3.0)
+        self.assertRaises(TypeError, choose, 20, 3.0)
+        self.assertRaises(TypeError, factorial, 5.0)
+        self.assertEqual(factorial(np.int64(5)), 120)
+
+    def test_large(self):
+        # beyond the float range of the old factorial quotient
+        self.assertEqual(choose(1000, 500), factorial(1000) // factorial(500)**2)
+        self.assertEqual(choose(10**5, 5 * 10**4), math.comb(10**5, 5 * 10**4))
+
+    def test_log_choose(self):
+        self.assertAlmostEqual(log_choose(1000, 500), math.log(choose(1000, 500)), places=9)
+        n, k = np.array([10, 100, 1000, 50]), np.array([3, 50, 999, 51])
+        expected = [math.log(choose(10, 3)), math.log(choose(100, 50)), math.log(1000), -np.inf]
+        np.testing.assert_allclose(log_choose(n, k), expected, rtol=1e-12)
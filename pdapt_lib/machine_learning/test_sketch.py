@@ -0,0 +1,83 @@
+import random
+import unittest
+import pdapt_lib.machine_learning.corpus as corpus
+from pdapt_lib.machine_learning.sketch import CountMinSketch, SpaceSaving, ApproximateCounts, approximate_tokenize
+
+
+def zipf_stream(length, vocabulary=2000, seed=0):
+    rng = random.Random(seed)
+    words = ["w%d" % i for i in range(vocabulary)]
+    weights = [1.0 / (i + 1) for i in range(vocabulary)]
+    return rng.choices(words, weights, k=length)
+
+
+def exact_counts(stream):
+    counts = {}
+    for w in stream:
+        counts[w] = counts.get(w, 0) + 1
+    return counts
+
+
+class TestSketch(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = zipf_stream(20000)
+        self.exact = exact_counts(self.stream)
+
+    def test_count_min_bounds(self):
+        sketch = CountMinSketch(epsilon=0.005, delta=0.01)
+        sketch.update_many(self.stream[:10000])
+        for w in self.stream[10000:]:
+            sketch.update(w)
+        self.assertEqual(sketch.total, len(self.stream))
+        for w, c in self.exact.items():
+            self.assertGreaterEqual(sketch[w], c)
+            self.assertLessEqual(sketch[w], c + sketch.epsilon * sketch.total)
+
+    def test_count_min_merge(self):
+        whole, a, b = [CountMinSketch(epsilon=0.01) for _ in range(3)]
+        whole.update_many(self.stream)
+        a.update_many(self.stream[:7000])
+        b.update_many(exact_counts(self.stream[7000:]))
+        merged = a.merge(b)
+        self.assertTrue((merged.table == whole.table).all())
+        self.assertEqual(merged.total, whole.total)
+        self.assertRaises(ValueError, a.merge, CountMinSketch(epsilon=0.02))
+
+    def check_space_saving(self, tracker, exact):
+        n = sum(exact.values())
+        for w, c in exact.items():
+            if c > n / float(tracker.k):
+                self.assertIn(w, tracker.counts)
+        for w, c in tracker.counts.items():
+            self.assertGreaterEqual(c, exact.get(w, 0))
+            self.assertLessEqual(c - tracker.errors[w], exact.get(w, 0))
+
+    def test_space_saving(self):
+        tracker = SpaceSaving(50)
+        tracker.update_many(self.stream)
+        self.assertEqual(len(tracker.counts), 50)
+        self.check_space_saving(tracker, self.exact)
+        a, b = SpaceSaving(50), SpaceSaving(50)
+        a.update_many(self.stream[:5000])
+        b.update_many(self.stream[5000:])
+        self.check_space_saving(a.merge(b), self.exact)
+
+    def test_approximate_counts_of_generator(self):
+        counts = ApproximateCounts(k=10)
+        counts.update_many(w for w in "a a b a c".split())
+        self.assertEqual((counts['a'], counts.total), (3, 5))
+        self.assertEqual(counts.top(), [('a', 3), ('b', 1), ('c', 1)])
+
+    def test_approximate_tokenize(self):
+        docs = [" ".join(self.stream[i:i+100]) for i in range(0, len(self.stream), 100)]
+        exact = corpus.count_corpus(docs, 2)
+        counts = approximate_tokenize(docs, 2, k=200)
+        top = sorted(exact.items(), key=lambda x: -x[1])[:3]
+        self.assertEqual(counts.top(1)[0][0], top[0][0])
+        self.assertTrue(set(w for w, c in top) <= set(w for w, c in counts.top(10)))
+        for w, c in exact.items():
+            self.assertGreaterEqual(counts[w], c)
+        half = len(docs) // 2
+        merged = approximate_tokenize(docs[:half], 2, k=200).merge(approximate_tokenize(docs[half:], 2, k=200))
+        self.assertEqual(merged.top(3), counts.top(3))
@@ -0,0 +1,48 @@
+import random
+import unittest
+import pdapt_lib.machine_learning.nlp as nlp
+import pdapt_lib.machine_learning.string_distance as sd
+
+
+def full_levenshtein(s, t):
+    previous = list(range(len(t) + 1))
+    for i in range(1, len(s) + 1):
+        current = [i] + [0] * len(t)
+        for j in range(1, len(t) + 1):
+            current[j] = min(previous[j-1] + (s[i-1] != t[j-1]), previous[j] + 1, current[j-1] + 1)
+        previous = current
+    return previous[-1]
+
+
+class TestStringDistance(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.codes = ["".join(rng.choice("ACGT") for _ in range(8)) for _ in range(300)]
+        self.words = ["".join(rng.choice("ab") for _ in range(rng.randint(0, 7))) for _ in range(60)]
+
+    def test_hamming_matrix(self):
+        D = sd.hamming_matrix(self.codes, block=64)
+        for i in range(0, 300, 29):
+            for j in range(300):
+                self.assertEqual(D[i, j], nlp.hamming_distance(self.codes[i], self.codes[j]))
+        self.assertEqual(sd.hamming_to_many(self.codes[5], self.codes).tolist(), D[5].tolist())
+        self.assertRaises(ValueError, sd.encode_strings, ['ab', 'abc'])
+
+    def test_hamming_pairs(self):
+        D = sd.hamming_matrix(self.codes)
+        for k in (0, 2, 3, 8):
+            expected = [(i, j, int(D[i, j])) for i in range(300) for j in range(i+1, 300) if D[i, j] <= k]
+            self.assertEqual(sd.hamming_pairs(self.codes, k), expected)
+
+    def test_levenshtein(self):
+        for s in self.words[:20]:
+            for t in self.words:
+                d = full_levenshtein(s, t)
+                self.assertEqual(sd.levenshtein(s, t), d)
+                for k in range(4):
+                    self.assertEqual(sd.levenshtein(s, t, k), min(d, k + 1))
+        expected = [(i, j, full_levenshtein(self.words[i], self.words[j]))
+                    for i in range(60) for j in range(i+1, 60)
+                    if full_levenshtein(self.words[i], self.words[j]) <= 2]
+        self.assertEqual(sd.levenshtein_pairs(self.words, 2), expected)
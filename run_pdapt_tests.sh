@@ -9,7 +9,7 @@ fi
 
 test=$1
 
-modules="maths stats probs cross_validation optimize regression classification nlp"
+modules="maths stats probs cross_validation optimize regression classification nlp corpus minhash sketch string_distance count_table neighbors"
 
 . ./venv/bin/activate
 